@@ -0,0 +1,161 @@
+import math
+import functools
+import numpy as np
+from src import Cube, Mask
+
+# order in which faces appear in piece names, so the first face of an edge or corner is its orientation reference:
+# U/D stickers for corners and U/D edges, F/B stickers for E slice edges
+name_order = ['U', 'D', 'F', 'B', 'R', 'L']
+
+
+# returns the standard name of a piece given by its letters in any order, e.g. "FU" -> "UF", "RUF" -> "UFR"
+def piece_name(piece_keys):
+    return ''.join(sorted(piece_keys, key=name_order.index))
+
+
+# lists the facelets of every piece, reference facelet first and corners in clockwise order
+# returns piece names, facelet lists, and per facelet the index of its piece and its position within the piece
+def init_pieces():
+    names = []
+    piece_facelets = []
+    for coords, face_to_facelet in Cube.coords_to_facelets.items():
+        faces = sorted(face_to_facelet.keys(), key=name_order.index)
+        if len(faces) == 3:
+            # clockwise when seen from outside the corner: the normals form a left-handed basis
+            normals = np.array([Cube.face_normals[face] for face in faces])
+            if np.linalg.det(normals) > 0:
+                faces = [faces[0], faces[2], faces[1]]
+        names.append(piece_name(faces))
+        piece_facelets.append([face_to_facelet[face] for face in faces])
+    facelet_to_piece = np.empty(54, dtype=np.intp)
+    facelet_slot = np.empty(54, dtype=np.intp)
+    for piece, facelets in enumerate(piece_facelets):
+        for slot, facelet in enumerate(facelets):
+            facelet_to_piece[facelet] = piece
+            facelet_slot[facelet] = slot
+    return names, piece_facelets, facelet_to_piece, facelet_slot
+
+
+piece_names, piece_facelets, facelet_to_piece, facelet_slot = init_pieces()
+name_to_piece = {name: piece for piece, name in enumerate(piece_names)}
+reference_facelets = np.array([facelets[0] for facelets in piece_facelets])
+
+
+# returns the cycles of a permutation given as an array mapping each element to its destination
+# fixed points are left out
+def get_cycles(destination):
+    cycles = []
+    seen = np.zeros(len(destination), dtype=bool)
+    for start in range(len(destination)):
+        if seen[start] or destination[start] == start:
+            continue
+        cycle = []
+        element = start
+        while not seen[element]:
+            seen[element] = True
+            cycle.append(int(element))
+            element = destination[element]
+        cycles.append(tuple(cycle))
+    return cycles
+
+
+# the effect of an algorithm derived from its facelet permutation alone, without simulating a cube
+# pieces are named by their home positions, and each piece is described by where it goes and how it turns:
+#   piece_destination: {piece: position it moves to}
+#   orientation_changes: {piece: twist}, 1 for flipped edges, 1 or 2 for corners twisted clockwise or counterclockwise
+class AlgorithmEffect:
+    def __init__(self, permutation: np.ndarray):
+        self.permutation = permutation
+        # facelet i of the new state is facelet permutation[i] of the old one
+        self.destination = np.argsort(permutation)
+        self.facelet_cycles = get_cycles(self.destination)
+        self.order = math.lcm(*[len(cycle) for cycle in self.facelet_cycles]) if self.facelet_cycles else 1
+
+        # the piece landing on each position and the slot of its facelet that lands on the reference facelet
+        sources = permutation[reference_facelets]
+        piece_from = facelet_to_piece[sources]
+        twists = facelet_slot[sources]
+        self.piece_destination = dict()
+        self.orientation_changes = dict()
+        piece_to = np.empty(len(piece_names), dtype=np.intp)
+        for position, (piece, twist) in enumerate(zip(piece_from, twists)):
+            piece_to[piece] = position
+            if piece != position:
+                self.piece_destination[piece_names[piece]] = piece_names[position]
+            if twist != 0:
+                self.orientation_changes[piece_names[piece]] = int(twist)
+        self.piece_cycles = [tuple(piece_names[piece] for piece in cycle) for cycle in get_cycles(piece_to)]
+
+        self.moved_pieces = set(self.piece_destination)
+        self.flipped_edges = {piece for piece in self.orientation_changes if len(piece) == 2}
+        self.twisted_corners = {piece for piece in self.orientation_changes if len(piece) == 3}
+        self.affected_pieces = self.moved_pieces | set(self.orientation_changes)
+
+    # returns the subset of the given pieces that the algorithm moves or reorients
+    def affects(self, pieces):
+        return {piece_name(piece) for piece in pieces} & self.affected_pieces
+
+    # returns the subset of the given pieces that the algorithm leaves solved in place
+    def preserves(self, pieces):
+        return {piece_name(piece) for piece in pieces} - self.affected_pieces
+
+    # returns True if the EO of the given edges (by default all edges) is changed by the algorithm
+    def changes_EO(self, edges=None):
+        if edges is None:
+            return bool(self.flipped_edges)
+        return bool({piece_name(edge) for edge in edges} & self.flipped_edges)
+
+    def changes_CO(self, corners=None):
+        if corners is None:
+            return bool(self.twisted_corners)
+        return bool({piece_name(corner) for corner in corners} & self.twisted_corners)
+
+    # returns the facelet indices that end up on each facelet of a piece position, in Cube.facelets order
+    # reading a state through them gives the piece colors after the algorithm without applying it
+    def facelets_after(self, piece_keys):
+        face_to_facelet = Cube.coords_to_facelets[tuple(Cube.string_to_index[frozenset(piece_keys)])]
+        return {face: int(self.permutation[facelet]) for face, facelet in face_to_facelet.items()}
+
+
+@functools.lru_cache(maxsize=Cube.compile_cache_size)
+def analyze_normalized_moves(move_str: str):
+    _, _, permutation = Cube.compile_normalized_moves(move_str)
+    return AlgorithmEffect(permutation)
+
+
+# returns the (cached) AlgorithmEffect of a string of moves
+def analyze_moves(move_str: str):
+    return analyze_normalized_moves(Cube.normalize_moves(move_str))
+
+
+# same result as the state-comparing Cube.CMLL_affects_EO, as long as the LSE edges are told apart by their colors
+# (always the case with F2B solved, a masked F2B piece on an LSE position can make the two differ)
+# the CMLL is analyzed once: unchanged edges come from set operations on its effect,
+# and the EO after the CMLL is read from the state before it through the permutation
+def CMLL_affects_EO(cube: Cube.Cube, CMLL: str, CMLLsetup: str, initial_EO: str, show_img=False, cache=None,
+                    sticker_mask=None):
+    cube.do_moves(initial_EO)
+    cube.do_moves(CMLLsetup)
+    effect = analyze_moves(CMLL)
+    previous_state = cube.get_state()
+    cube.do_moves(CMLL)
+    LSE = ['UF', 'UR', 'UB', 'UL', 'DF', 'DB']
+    unchanged = effect.preserves(LSE)
+    LSE_before = cube.EO_mask(previous_state)
+    LSE_after = dict()
+    for edge_str in LSE:
+        color = chr(previous_state[effect.facelets_after(edge_str)[edge_str[0]]])
+        LSE_after[edge_str] = 'y' if color == 'w' or color == 'y' else 'm'
+    for edge_str in LSE:
+        if edge_str in unchanged:
+            LSE_before[edge_str] = 't'
+            LSE_after[edge_str] = 't'
+
+    mask_before = Mask.StickerMask.from_pieces(LSE, [LSE_before[edge_str] for edge_str in LSE])
+    mask_after = Mask.StickerMask.from_pieces(LSE, [LSE_after[edge_str] for edge_str in LSE])
+    if sticker_mask is not None:
+        mask_before, mask_after = sticker_mask.then(mask_before), sticker_mask.then(mask_after)
+    url_before = cube.viscube_image(translucent=True, show_img=show_img, mask=previous_state, cache=cache,
+                                    sticker_mask=mask_before)
+    url_after = cube.viscube_image(translucent=True, show_img=show_img, cache=cache, sticker_mask=mask_after)
+    return url_before, url_after
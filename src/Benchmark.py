@@ -0,0 +1,289 @@
+import gc
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+from io import BytesIO
+from unittest import mock
+import numpy as np
+from src import Cube
+
+# relative to the working directory, ignored by git in the repository root
+default_baseline = 'benchmarks.json'
+default_threshold = 0.2             # slowdown of ops/sec that counts as a regression
+default_memory_threshold = 0.5      # growth of peak memory per run that counts as a regression
+
+eo_cases = ["M'U'MU2M'UM", "M'U'MU2M'UMU", "M'U'MU2M'UMU'", "M'U'MU2M'UMU2", "M'UMU'M'UM", "M'UMU'M'UMU",
+            "M'U'MU'M'U'M", "M'U'MU'M'U'MU", "M'U'MU'M'U'MU'", "M'U'MU'M'U'MU2", "MU'MU2MU2M", "MUM", "MUMU",
+            "MUMU'", "MUMU2"]
+cmll = "r U' r2' D' r U' r' D r2 U r'"
+cmll_setup = "L' U R U' L U' R' U' R U' R' M2 U M' U2 M U M2 U'"
+
+
+def random_moves(rng: random.Random, length: int, moves=None):
+    moves = moves or Cube.valid_moves
+    return ' '.join(rng.choice(moves) + rng.choice(['', "'", '2']) for _ in range(length))
+
+
+main_pieces = ['U', 'R', 'F', 'D', 'L', 'B', 'LF', 'LD', 'LB', 'LFD', 'LBD', 'RF', 'RD', 'RB', 'RFD', 'RBD']
+
+
+# yellow top, red front, F2B and centers masked in the state
+def main_cube():
+    cube = Cube.Cube()
+    cube.do_moves('y z2')
+    for piece_str in main_pieces:
+        cube.set_piece_color([char for char in piece_str], 't')
+    return cube
+
+
+# every benchmark takes a seeded random.Random and returns (run, ops): run() does ops operations
+# workloads are built before timing, so only the measured calls are timed
+
+def bench_move(rng):
+    cube = Cube.Cube()
+    moves = [(rng.choice(Cube.valid_moves), rng.randint(1, 3)) for _ in range(10000)]
+
+    def run():
+        for move, magnitude in moves:
+            cube.move(move, magnitude)
+    return run, len(moves)
+
+
+# repeated algorithms, as in sweeps: served by the compile cache
+def bench_do_moves_cached(rng):
+    cube = Cube.Cube()
+    algorithms = [random_moves(rng, 20) for _ in range(50)]
+    sequence = [rng.choice(algorithms) for _ in range(5000)]
+
+    def run():
+        for algorithm in sequence:
+            cube.do_moves(algorithm)
+    return run, len(sequence)
+
+
+# distinct scrambles: every call parses and composes
+def bench_do_moves_uncached(rng):
+    cube = Cube.Cube()
+    scrambles = [random_moves(rng, 20) for _ in range(1000)]
+
+    def run():
+        Cube.compile_cache_clear()
+        for scramble in scrambles:
+            cube.do_moves(scramble)
+    return run, len(scrambles)
+
+
+def bench_parse_moves(rng):
+    algorithms = [random_moves(rng, 30) for _ in range(5000)]
+
+    def run():
+        for algorithm in algorithms:
+            Cube.parse_moves(algorithm)
+    return run, len(algorithms)
+
+
+def bench_get_state(rng):
+    cube = Cube.Cube()
+    cube.do_moves(random_moves(rng, 20))
+
+    def run():
+        for _ in range(10000):
+            cube.get_state()
+    return run, 10000
+
+
+def bench_set_state(rng):
+    cube = Cube.Cube()
+    states = []
+    for _ in range(100):
+        cube.do_moves(random_moves(rng, 20))
+        states.append(cube.get_state())
+
+    def run():
+        for _ in range(100):
+            for state in states:
+                cube.set_state(state)
+    return run, 100 * len(states)
+
+
+def bench_get_facelets(rng):
+    cube = main_cube()
+    cube.do_moves(random_moves(rng, 20, ['U', 'M']))
+    mask = cube.get_state()
+
+    def run():
+        for _ in range(2000):
+            cube.get_facelets(mask)
+    return run, 2000
+
+
+def bench_EO_mask(rng):
+    cube = main_cube()
+    states = []
+    for _ in range(20):
+        cube.do_moves(random_moves(rng, 20, ['U', 'M']))
+        states.append(cube.get_state())
+
+    def run():
+        for _ in range(100):
+            for state in states:
+                cube.EO_mask(state)
+    return run, 100 * len(states)
+
+
+# the EO sweep of main.py, one op is one EO case
+def bench_CMLL_affects_EO(rng):
+    from src import Mask
+    cube = Cube.Cube()
+    cube.do_moves('y z2')
+    sticker_mask = Mask.StickerMask.from_pieces(main_pieces, 't' * len(main_pieces))
+    initial_state = cube.snapshot()
+
+    def run():
+        for eo_setup in eo_cases:
+            cube.CMLL_affects_EO(cmll, cmll_setup, eo_setup, sticker_mask=sticker_mask)
+            cube.restore(initial_state)
+    return run, len(eo_cases)
+
+
+# viscube_image with the image fetched and shown, both mocked: measures everything around the network
+def bench_viscube_image(rng):
+    from PIL import Image
+    cube = main_cube()
+    cube.do_moves(random_moves(rng, 20, ['U', 'M']))
+    image = BytesIO()
+    Image.new('RGB', (150, 150), 'white').save(image, 'PNG')
+    response = mock.Mock(content=image.getvalue(), status_code=200)
+
+    def run():
+        with mock.patch('requests.get', return_value=response), mock.patch.object(Image.Image, 'show'):
+            for _ in range(200):
+                cube.viscube_image(translucent=True)
+    return run, 200
+
+
+benchmarks = {
+    'move': bench_move,
+    'do_moves_cached': bench_do_moves_cached,
+    'do_moves_uncached': bench_do_moves_uncached,
+    'parse_moves': bench_parse_moves,
+    'get_state': bench_get_state,
+    'set_state': bench_set_state,
+    'get_facelets': bench_get_facelets,
+    'EO_mask': bench_EO_mask,
+    'CMLL_affects_EO': bench_CMLL_affects_EO,
+    'viscube_image': bench_viscube_image,
+}
+
+
+def no_network(*args, **kwargs):
+    raise RuntimeError("benchmarks must not use the network")
+
+
+# runs one benchmark: the best of repeat timed runs gives ops/sec, one more run under tracemalloc gives
+# the peak memory allocated during a run and the blocks still allocated after it (per op)
+# these stand in for allocation counts, which CPython does not keep
+def run_benchmark(name: str, seed: int = 0, repeat: int = 5):
+    run, ops = benchmarks[name](random.Random(seed))
+    run()       # warm up caches, as a long-running sweep would
+    times = []
+    gc.collect()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    blocks_before = sys.getallocatedblocks()
+    run()
+    blocks_after = sys.getallocatedblocks()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'ops': ops,
+        'ops_per_second': ops / min(times),
+        'mean_seconds': sum(times) / len(times),
+        'peak_bytes': peak,
+        'retained_blocks_per_op': (blocks_after - blocks_before) / ops,
+    }
+
+
+def run_benchmarks(names=None, seed: int = 0, repeat: int = 5, verbose=True):
+    results = dict()
+    with mock.patch('requests.get', side_effect=no_network):
+        for name in names or benchmarks:
+            results[name] = run_benchmark(name, seed, repeat)
+            if verbose:
+                result = results[name]
+                print('%-20s %14.0f ops/s %12d peak bytes %8.2f retained blocks/op'
+                      % (name, result['ops_per_second'], result['peak_bytes'], result['retained_blocks_per_op']))
+    return {
+        'meta': {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+                 'seed': seed, 'repeat': repeat},
+        'results': results,
+    }
+
+
+# compares results against a baseline, returns a list of regression messages
+# thresholds maps benchmark names to allowed slowdowns, others use threshold
+def compare(results: dict, baseline: dict, threshold: float = default_threshold, thresholds: dict = None,
+            memory_threshold: float = default_memory_threshold):
+    regressions = []
+    for name, result in results['results'].items():
+        if name not in baseline['results']:
+            continue
+        base = baseline['results'][name]
+        allowed = (thresholds or {}).get(name, threshold)
+        change = result['ops_per_second'] / base['ops_per_second'] - 1
+        if change < -allowed:
+            regressions.append('%s: %.0f ops/s is %.0f%% slower than the baseline %.0f ops/s'
+                               % (name, result['ops_per_second'], -100 * change, base['ops_per_second']))
+        if result['peak_bytes'] > base['peak_bytes'] * (1 + memory_threshold) + 4096:
+            regressions.append('%s: peak memory %d bytes grew from %d bytes'
+                               % (name, result['peak_bytes'], base['peak_bytes']))
+    return regressions
+
+
+# python -m src.Benchmark                      run, and compare with benchmarks.json if it exists
+# python -m src.Benchmark --save               run and save the results as the new baseline
+# python -m src.Benchmark --threshold 0.1 --threshold-for move=0.3 --only move do_moves_cached
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CubeSim benchmarks")
+    parser.add_argument('--baseline', default=default_baseline, help="baseline JSON file")
+    parser.add_argument('--save', action='store_true', help="save the results as the baseline")
+    parser.add_argument('--only', nargs='+', choices=list(benchmarks), help="benchmarks to run")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--threshold', type=float, default=default_threshold, help="allowed slowdown, e.g. 0.2")
+    parser.add_argument('--threshold-for', nargs='+', default=[], metavar='NAME=VALUE',
+                        help="allowed slowdown of single benchmarks")
+    parser.add_argument('--memory-threshold', type=float, default=default_memory_threshold)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.only, args.seed, args.repeat)
+    if args.save:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2)
+        print('saved baseline to', args.baseline)
+        return 0
+    try:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        print('no baseline at', args.baseline + ', run with --save to create one')
+        return 0
+    thresholds = {name: float(value) for name, value in (item.split('=') for item in args.threshold_for)}
+    regressions = compare(results, baseline, args.threshold, thresholds, args.memory_threshold)
+    for regression in regressions:
+        print('REGRESSION', regression)
+    if not regressions:
+        print('no regressions against', args.baseline)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
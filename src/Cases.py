@@ -0,0 +1,244 @@
+import os
+import json
+import math
+import numpy as np
+from src import Cube, Analysis, Symmetry
+
+chunk_rows = 1 << 16            # frontier rows expanded at once
+max_index_bits = 1 << 36        # largest visited bitset allowed (8 GiB)
+
+
+# returns the generating moves of a move set such as "M U" or "<M, U>", each with the given magnitudes
+def get_generators(move_set: str, magnitudes=(1, 2, 3)):
+    letters = move_set.replace('<', ' ').replace('>', ' ').replace(',', ' ').split()
+    for letter in letters:
+        if letter not in Cube.valid_moves:
+            raise ValueError("invalid move " + letter + " in move set " + move_set)
+    names = []
+    permutations = []
+    for letter in letters:
+        for magnitude in magnitudes:
+            names.append(letter + {1: '', 2: '2', 3: "'"}[magnitude])
+            permutations.append(Cube.move_tables[letter][magnitude])
+    return names, np.array(permutations, dtype=np.intp)
+
+
+# groups the piece positions moved by the generators into orbits
+# returns a list of orbits, each an array of shape (positions, stickers) of facelet indices in reference order
+def get_orbits(permutations: np.ndarray):
+    destination = np.argsort(permutations, axis=1)
+    position_of = Analysis.facelet_to_piece
+    orbits = []
+    assigned = set()
+    for piece, facelets in enumerate(Analysis.piece_facelets):
+        if piece in assigned or all((destination[:, facelets[0]] == facelets[0]).tolist()):
+            continue
+        orbit = [piece]
+        assigned.add(piece)
+        for position in orbit:
+            for target in position_of[destination[:, Analysis.piece_facelets[position][0]]].tolist():
+                if target not in assigned:
+                    assigned.add(target)
+                    orbit.append(target)
+        orbits.append(np.array([Analysis.piece_facelets[position] for position in sorted(orbit)], dtype=np.intp))
+    return orbits
+
+
+# a perfect index of masked states: each orbit of piece positions is ranked as the arrangement of its pieces
+# (pieces with the same colors, e.g. masked ones, are interchangeable) times the orientation of each position
+# two states get the same index exactly when their moved facelets have the same colors
+class StateIndexer:
+    def __init__(self, start: np.ndarray, permutations: np.ndarray):
+        self.orbits = get_orbits(permutations)
+        self.labels = []            # sorted label codes of each orbit
+        self.counts = []            # how many pieces of the orbit carry each label
+        self.twists = []            # orientations a position can hold, 1 if the generators never twist the orbit
+        self.radices = []
+        destination = np.argsort(permutations, axis=1)
+        for orbit in self.orbits:
+            twisted = np.isin(destination[:, orbit[:, 0]], orbit[:, 1:]).any()
+            self.twists.append(orbit.shape[1] if twisted else 1)
+            labels, _ = self.read_orbit(start[None, :], orbit, self.twists[-1])
+            values, counts = np.unique(labels[0], return_counts=True)
+            self.labels.append(values)
+            self.counts.append(counts)
+            arrangements = math.factorial(len(orbit)) // math.prod(math.factorial(int(count)) for count in counts)
+            self.radices.append(arrangements * self.twists[-1] ** len(orbit))
+        self.size = math.prod(self.radices)
+        self.factorials = np.array([math.factorial(k) for k in range(max(len(orbit) for orbit in self.orbits) + 1)],
+                                   dtype=np.int64)
+
+    # returns per position the label (its colors rotated to the smallest reading) and the rotation of the reading
+    # without twists the colors are read as they are, so pieces keep apart by their fixed orientation
+    @staticmethod
+    def read_orbit(states: np.ndarray, orbit: np.ndarray, twists: int):
+        colors = states[:, orbit].astype(np.int64)
+        weights = 256 ** np.arange(orbit.shape[1] - 1, -1, -1)
+        codes = np.stack([(np.roll(colors, -r, axis=2) * weights).sum(axis=2) for r in range(twists)], axis=2)
+        return codes.min(axis=2), codes.argmin(axis=2)
+
+    # returns the indices of states of shape (N, 54) as int64
+    def index(self, states: np.ndarray):
+        index = np.zeros(len(states), dtype=np.int64)
+        for orbit, values, counts, twists, radix in zip(self.orbits, self.labels, self.counts, self.twists, self.radices):
+            labels, rotations = self.read_orbit(states, orbit, twists)
+            labels = np.searchsorted(values, labels)
+            # lexicographic rank of the arrangement of labels, a permutation of a multiset
+            remaining = np.tile(counts.astype(np.int64), (len(states), 1))
+            rows = np.arange(len(states))
+            rank = np.zeros(len(states), dtype=np.int64)
+            for position in range(len(orbit)):
+                left = len(orbit) - position - 1
+                for label in range(len(values)):
+                    smaller = (labels[:, position] > label) & (remaining[:, label] > 0)
+                    if smaller.any():
+                        remaining[:, label] -= 1
+                        arrangements = self.factorials[left] // np.prod(self.factorials[np.maximum(remaining, 0)], axis=1)
+                        rank += np.where(smaller, arrangements, 0)
+                        remaining[:, label] += 1
+                remaining[rows, labels[:, position]] -= 1
+            orientation = (rotations * twists ** np.arange(len(orbit) - 1, -1, -1)).sum(axis=1)
+            index = index * radix + rank * twists ** len(orbit) + orientation
+        return index
+
+
+# visited states as one bit per index
+class Bitset:
+    def __init__(self, size: int):
+        self.bits = np.zeros((size + 7) // 8, dtype=np.uint8)
+
+    def contains(self, indices: np.ndarray):
+        return (self.bits[indices >> 3] >> (indices & 7).astype(np.uint8)) & 1 == 1
+
+    def add(self, indices: np.ndarray):
+        np.bitwise_or.at(self.bits, indices >> 3, (1 << (indices & 7)).astype(np.uint8))
+
+
+# the files of a case table, all indexed by row: rows are in BFS order, so distances never decrease
+table_files = {
+    'states': (np.uint8, 54),       # facelet colors, as Cube.facelets
+    'indices': (np.int64, 1),       # StateIndexer index, sorted within each appended block
+    'parents': (np.int64, 1),       # row of the state one move closer to the start (-1 for the start)
+    'generators': (np.uint8, 1),    # generator leading from the parent to the state
+}
+
+
+# enumerates every state reachable from a (masked) cube with a move set, e.g. enumerate_cases(cube, "<M, U>", "lse")
+# the states are found layer by layer and appended to files in directory as they are found, with the visited set kept
+# as a bitset over StateIndexer indices, so memory is bounded by the bitset and one chunk of the frontier
+# returns a CaseTable of the result
+def enumerate_cases(cube, move_set: str, directory: str, max_depth: int = None, magnitudes=(1, 2, 3), verbose=False):
+    start = np.array(cube.facelets if isinstance(cube, Cube.Cube) else cube, dtype=np.uint8).reshape(54)
+    names, permutations = get_generators(move_set, magnitudes)
+    indexer = StateIndexer(start, permutations)
+    if indexer.size > max_index_bits:
+        raise ValueError("the state space of %d indices is too large, mask more pieces" % indexer.size)
+    visited = Bitset(indexer.size)
+    os.makedirs(directory, exist_ok=True)
+    files = {name: open(os.path.join(directory, name + '.bin'), 'wb') for name in table_files}
+
+    blocks = []         # [first row, end row] of each sorted block
+
+    def append(states, indices, parents, generators):
+        first = blocks[-1][1] if blocks else 0
+        blocks.append([first, first + len(indices)])
+        order = np.argsort(indices)
+        states[order].tofile(files['states'])
+        indices[order].tofile(files['indices'])
+        parents[order].astype(np.int64).tofile(files['parents'])
+        generators[order].astype(np.uint8).tofile(files['generators'])
+        for file in files.values():
+            file.flush()
+
+    start_index = indexer.index(start[None, :])
+    visited.add(start_index)
+    append(start[None, :], start_index, np.array([-1]), np.array([0]))
+    layers = [[0, 1]]       # [first row, end row] of each distance
+    try:
+        while max_depth is None or len(layers) <= max_depth:
+            first, end = layers[-1]
+            states_file = np.memmap(os.path.join(directory, 'states.bin'), dtype=np.uint8, mode='r').reshape(-1, 54)
+            layer_end = end
+            for chunk_start in range(first, end, chunk_rows):
+                frontier = np.asarray(states_file[chunk_start:min(end, chunk_start + chunk_rows)])
+                neighbors = frontier[:, permutations].reshape(-1, 54)
+                indices = indexer.index(neighbors)
+                indices, positions = np.unique(indices, return_index=True)
+                new = ~visited.contains(indices)
+                indices, positions = indices[new], positions[new]
+                if not len(indices):
+                    continue
+                visited.add(indices)
+                parents = chunk_start + positions // len(names)
+                append(neighbors[positions], indices, parents, positions % len(names))
+                layer_end += len(indices)
+            del states_file
+            if layer_end == end:
+                break
+            layers.append([end, layer_end])
+            if verbose:
+                print('distance', len(layers) - 1, 'states', layer_end - end)
+    finally:
+        for file in files.values():
+            file.close()
+    with open(os.path.join(directory, 'meta.json'), 'w') as file:
+        json.dump({'move_set': move_set, 'magnitudes': list(magnitudes), 'moves': names, 'layers': layers,
+                   'blocks': blocks, 'index_size': indexer.size, 'start': start.tobytes().decode('ascii')}, file)
+    return CaseTable(directory)
+
+
+# a table written by enumerate_cases, read through memory maps
+class CaseTable:
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as file:
+            meta = json.load(file)
+        self.move_set = meta['move_set']
+        self.magnitudes = meta['magnitudes']
+        self.moves = meta['moves']
+        self.layers = meta['layers']
+        self.blocks = meta['blocks']
+        self.start = np.frombuffer(meta['start'].encode('ascii'), dtype=np.uint8)
+        for name, (dtype, width) in table_files.items():
+            data = np.memmap(os.path.join(directory, name + '.bin'), dtype=dtype, mode='r')
+            setattr(self, name, data.reshape(-1, width) if width > 1 else data)
+        self.distances = np.repeat(np.arange(len(self.layers), dtype=np.uint8), [end - first for first, end in self.layers])
+        self.indexer = None
+
+    def __len__(self):
+        return len(self.indices)
+
+    def distance(self, row: int):
+        return int(self.distances[row])
+
+    # counts of states per distance
+    def distribution(self):
+        return [end - first for first, end in self.layers]
+
+    # returns a shortest move string taking the start state to the state of a row
+    def algorithm(self, row: int):
+        moves = []
+        while self.parents[row] >= 0:
+            moves.append(self.moves[self.generators[row]])
+            row = int(self.parents[row])
+        return ' '.join(reversed(moves))
+
+    # returns the row of a state, or -1 if it is not in the table
+    def find(self, state):
+        if self.indexer is None:
+            _, permutations = get_generators(self.move_set, self.magnitudes)
+            self.indexer = StateIndexer(self.start, permutations)
+        index = int(self.indexer.index(np.asarray(state, dtype=np.uint8).reshape(1, 54))[0])
+        for first, end in self.blocks:
+            row = first + int(np.searchsorted(self.indices[first:end], index))
+            if row < end and self.indices[row] == index:
+                return row
+        return -1
+
+    # yields (row, algorithm) for every state, or only for one state per class of a Symmetry.TranspositionTable
+    def cases(self, table: Symmetry.TranspositionTable = None):
+        for first in range(0, len(self), chunk_rows):
+            rows = np.arange(first, min(len(self), first + chunk_rows))
+            new = table.filter_new(self.states[rows]) if table is not None else np.ones(len(rows), dtype=bool)
+            for row in rows[new].tolist():
+                yield row, self.algorithm(row)
@@ -0,0 +1,342 @@
+import os
+import math
+import functools
+import itertools
+import numpy as np
+from src import Cube
+
+# cubie model in the usual Kociemba order, each piece lists its faces starting with its orientation reference
+# corner faces are listed clockwise, so that twisting a corner clockwise moves its reference sticker to the next face
+corner_names = ['URF', 'UFL', 'ULB', 'UBR', 'DFR', 'DLF', 'DBL', 'DRB']
+edge_names = ['UR', 'UF', 'UL', 'UB', 'DR', 'DF', 'DL', 'DB', 'FR', 'FL', 'BL', 'BR']
+
+# edge subsets whose "sorted" coordinates (positions and order of 4 edges, 0..11879) together give the edge permutation
+edge_subsets = {
+    'slice': [8, 9, 10, 11],
+    'U_edges': [0, 1, 2, 3],
+    'D_edges': [4, 5, 6, 7],
+}
+
+# the 18 face turns, coordinates cannot follow slice, wide or rotation moves since those move the centers
+coordinate_moves = [face + str(magnitude) for face in Cube.face_keys for magnitude in (1, 2, 3)]
+coordinate_move_index = {name: index for index, name in enumerate(coordinate_moves)}
+
+# directory where move and pruning tables are stored as .npy files, they are memory-mapped once built
+table_directory = os.environ.get('CUBESIM_TABLES', os.path.join(os.path.expanduser('~'), '.cache', 'cubesim'))
+
+coordinate_sizes = {
+    'CO': 3 ** 7,
+    'EO': 2 ** 11,
+    'CP': math.factorial(8),
+    'EP': math.factorial(12),
+    'slice': 11880,
+    'U_edges': 11880,
+    'D_edges': 11880,
+}
+
+
+def piece_facelet_indices(names):
+    facelets = []
+    for name in names:
+        face_to_facelet = Cube.coords_to_facelets[tuple(Cube.string_to_index[frozenset(name)])]
+        facelets.append([face_to_facelet[face] for face in name])
+    return np.array(facelets)
+
+
+corner_facelets = piece_facelet_indices(corner_names)
+edge_facelets = piece_facelet_indices(edge_names)
+center_facelets = np.array([9 * i + 4 for i in range(6)])
+
+
+# derives the cubie-level effect of a facelet permutation
+# returns (piece_from, twist): the piece at position i comes from position piece_from[i] and its orientation grows by twist[i]
+def cubie_move(permutation, piece_facelets):
+    facelet_to_position = {facelet: (position, slot)
+                           for position, facelets in enumerate(piece_facelets) for slot, facelet in enumerate(facelets)}
+    orientations = piece_facelets.shape[1]
+    piece_from = np.empty(len(piece_facelets), dtype=np.intp)
+    twist = np.empty(len(piece_facelets), dtype=np.intp)
+    for position, facelets in enumerate(piece_facelets):
+        piece_from[position], slot = facelet_to_position[int(permutation[facelets[0]])]
+        twist[position] = -slot % orientations
+    return piece_from, twist
+
+
+corner_moves = [cubie_move(Cube.move_tables[name[0]][int(name[1])], corner_facelets) for name in coordinate_moves]
+edge_moves = [cubie_move(Cube.move_tables[name[0]][int(name[1])], edge_facelets) for name in coordinate_moves]
+
+
+# vectorized conversions between cubie arrays of shape (N, n) and coordinates of shape (N,)
+
+def rank_permutations(permutations):
+    n = permutations.shape[1]
+    smaller_after = (permutations[:, np.newaxis, :] < permutations[:, :, np.newaxis]) & np.triu(np.ones((n, n), bool), 1)
+    weights = np.array([math.factorial(n - 1 - i) for i in range(n)], dtype=np.int64)
+    return smaller_after.sum(axis=2) @ weights
+
+
+def unrank_permutations(ranks, n):
+    ranks = np.asarray(ranks, dtype=np.int64).copy()
+    available = np.tile(np.arange(n), (len(ranks), 1))
+    permutations = np.empty((len(ranks), n), dtype=np.intp)
+    rows = np.arange(len(ranks))
+    for i in range(n):
+        weight = math.factorial(n - 1 - i)
+        digits = ranks // weight
+        ranks %= weight
+        permutations[:, i] = available[rows, digits]
+        # drop the chosen element, keeping the remaining ones in increasing order
+        keep = np.ones(available.shape, dtype=bool)
+        keep[rows, digits] = False
+        available = available[keep].reshape(len(ranks), n - 1 - i)
+    return permutations
+
+
+# orientations of all but the last piece in base 3 (corners) or 2 (edges), the last one is fixed by the others
+def rank_orientations(orientations, base):
+    n = orientations.shape[1]
+    weights = base ** np.arange(n - 2, -1, -1, dtype=np.int64)
+    return orientations[:, :-1].astype(np.int64) @ weights
+
+
+def unrank_orientations(ranks, base, n):
+    ranks = np.asarray(ranks, dtype=np.int64)
+    orientations = np.empty((len(ranks), n), dtype=np.intp)
+    for i in range(n - 1):
+        orientations[:, i] = ranks // base ** (n - 2 - i) % base
+    orientations[:, -1] = -orientations[:, :-1].sum(axis=1) % base
+    return orientations
+
+
+# all combinations of 4 of the 12 edge positions, indexed by their colexicographic rank
+subset_combinations = np.array(sorted(itertools.combinations(range(12), 4), key=lambda c: sum(math.comb(p, k + 1) for k, p in enumerate(c))))
+binomials = np.array([[math.comb(n, k) for k in range(5)] for n in range(12)], dtype=np.int64)
+
+
+# position (among 495 choices) and order (among 24) of the 4 edges of a subset
+def rank_edge_subsets(edge_permutations, subset):
+    subset = np.asarray(subset)
+    in_subset = np.isin(edge_permutations, subset)
+    positions = np.nonzero(in_subset)[1].reshape(-1, 4)
+    combination = binomials[positions, np.arange(1, 5)].sum(axis=1)
+    edges = np.take_along_axis(edge_permutations, positions, axis=1)
+    order = np.searchsorted(subset, edges)
+    return combination * 24 + rank_permutations(order)
+
+
+# returns partial edge permutations with -1 for edges outside the subset
+def unrank_edge_subsets(ranks, subset):
+    ranks = np.asarray(ranks, dtype=np.int64)
+    edge_permutations = np.full((len(ranks), 12), -1, dtype=np.intp)
+    positions = subset_combinations[ranks // 24]
+    np.put_along_axis(edge_permutations, positions, np.asarray(subset)[unrank_permutations(ranks % 24, 4)], axis=1)
+    return edge_permutations
+
+
+def apply_permutation_move(permutations, move):
+    piece_from, _ = move
+    return permutations[:, piece_from]
+
+
+def apply_orientation_move(orientations, move, base):
+    piece_from, twist = move
+    return (orientations[:, piece_from] + twist) % base
+
+
+# loads a table from table_directory as a read-only memory map, building and saving it first if needed
+# memory-mapped tables are shared between processes through the page cache
+def cached_table(name: str, build):
+    path = os.path.join(table_directory, name + '.npy')
+    if not os.path.exists(path):
+        os.makedirs(table_directory, exist_ok=True)
+        temp_path = path + '.%d.tmp.npy' % os.getpid()
+        np.save(temp_path, build())
+        os.replace(temp_path, path)     # concurrent builders never expose a partial file
+    return np.load(path, mmap_mode='r')
+
+
+# returns the move table of a coordinate: table[coordinate, move] is the coordinate after the move
+@functools.lru_cache(maxsize=None)
+def get_move_table(name: str):
+    return cached_table('move_' + name, lambda: build_move_table(name))
+
+
+def build_move_table(name: str):
+    values = np.arange(coordinate_sizes[name])
+    table = np.empty((len(values), len(coordinate_moves)), dtype=np.uint16)
+    for move_index in range(len(coordinate_moves)):
+        if name == 'CO':
+            moved = apply_orientation_move(unrank_orientations(values, 3, 8), corner_moves[move_index], 3)
+            table[:, move_index] = rank_orientations(moved, 3)
+        elif name == 'EO':
+            moved = apply_orientation_move(unrank_orientations(values, 2, 12), edge_moves[move_index], 2)
+            table[:, move_index] = rank_orientations(moved, 2)
+        elif name == 'CP':
+            moved = apply_permutation_move(unrank_permutations(values, 8), corner_moves[move_index])
+            table[:, move_index] = rank_permutations(moved)
+        elif name in edge_subsets:
+            moved = apply_permutation_move(unrank_edge_subsets(values, edge_subsets[name]), edge_moves[move_index])
+            table[:, move_index] = rank_edge_subsets(moved, edge_subsets[name])
+        else:
+            raise ValueError("no move table for coordinate " + name)
+    return table
+
+
+# returns the color of each face from the centers of a facelet array of shape (N, 54)
+def get_center_colors(facelets):
+    return facelets[:, center_facelets]
+
+
+# converts facelet arrays of shape (N, 54) (or a single state) into cubie arrays (cp, co, ep, eo)
+# pieces are recognized from the center colors, so any whole-cube rotation is fine
+# raises ValueError if a piece cannot be recognized, e.g. because it is masked
+def facelets_to_cubies(facelets):
+    facelets = np.atleast_2d(facelets)
+    center_colors = get_center_colors(facelets)
+    # face index of every sticker color, per state
+    color_to_face = np.full((len(facelets), 256), -1, dtype=np.intp)
+    np.put_along_axis(color_to_face, center_colors.astype(np.intp), np.arange(6)[np.newaxis].repeat(len(facelets), 0), axis=1)
+    faces = np.take_along_axis(color_to_face, facelets.astype(np.intp), axis=1)
+
+    cubies = []
+    for names, piece_facelets, base in ((corner_names, corner_facelets, 3), (edge_names, edge_facelets, 2)):
+        piece_faces = faces[:, piece_facelets]      # (N, pieces, stickers)
+        if (piece_faces < 0).any():
+            raise ValueError("facelets do not match the center colors")
+        # pieces are identified by their set of faces, as a bit mask
+        keys = (1 << piece_faces).sum(axis=2)
+        key_to_piece = np.full(64, -1, dtype=np.intp)
+        for piece, name in enumerate(names):
+            key_to_piece[sum(1 << Cube.face_keys.index(face) for face in name)] = piece
+        permutation = key_to_piece[keys]
+        if (permutation < 0).any() or not (np.sort(permutation, axis=1) == np.arange(len(names))).all():
+            raise ValueError("facelets are not a valid arrangement of pieces")
+        reference_faces = np.array([Cube.face_keys.index(name[0]) for name in names])[permutation]
+        orientation = (piece_faces == reference_faces[..., np.newaxis]).argmax(axis=2)
+        cubies += [permutation, orientation]
+    return tuple(cubies)
+
+
+# the face of each sticker of a piece with each orientation: table[piece, orientation, sticker]
+# the sticker of face slot of the piece lands on the position's sticker (slot + orientation)
+def init_sticker_faces(names, base):
+    name_faces = np.array([[Cube.face_keys.index(face) for face in name] for name in names])
+    table = np.empty((len(names), base, base), dtype=np.intp)
+    for orientation in range(base):
+        for sticker in range(base):
+            table[:, orientation, sticker] = name_faces[:, (sticker - orientation) % base]
+    return table
+
+
+corner_sticker_faces = init_sticker_faces(corner_names, 3)
+edge_sticker_faces = init_sticker_faces(edge_names, 2)
+
+
+# parity of each row of permutations (N, n), True for odd permutations
+def permutation_parities(permutations: np.ndarray):
+    n = permutations.shape[1]
+    inversions = (permutations[:, :, np.newaxis] > permutations[:, np.newaxis, :]) & np.triu(np.ones((n, n), bool), 1)
+    return inversions.sum(axis=(1, 2)) % 2 == 1
+
+
+# raises ValueError unless every row of the cubie arrays is a solvable cube: the corner twists sum to 0 mod 3,
+# the edge flips to 0 mod 2 and the corner and edge permutations have the same parity
+def check_cubies(cp, co, ep, eo):
+    cp, co, ep, eo = [np.atleast_2d(array) for array in (cp, co, ep, eo)]
+    if (co.sum(axis=1) % 3).any():
+        raise ValueError("a corner is twisted: the corner orientations do not sum to 0 mod 3")
+    if (eo.sum(axis=1) % 2).any():
+        raise ValueError("an edge is flipped: the edge orientations do not sum to 0 mod 2")
+    if (permutation_parities(cp) != permutation_parities(ep)).any():
+        raise ValueError("two pieces are swapped: the corner and edge permutations have different parities")
+
+
+# converts cubie arrays into facelet arrays of shape (N, 54) using the center colors of center_colors (N, 6)
+def cubies_to_facelets(cp, co, ep, eo, center_colors):
+    cp, co, ep, eo = [np.atleast_2d(array) for array in (cp, co, ep, eo)]
+    center_colors = np.atleast_2d(center_colors)
+    facelets = np.empty((len(cp), 54), dtype=np.uint8)
+    facelets[:, center_facelets] = center_colors
+    for sticker_faces, piece_facelets, permutation, orientation in (
+            (corner_sticker_faces, corner_facelets, cp, co), (edge_sticker_faces, edge_facelets, ep, eo)):
+        faces = sticker_faces[permutation, orientation].reshape(len(cp), -1)
+        facelets[:, piece_facelets.ravel()] = np.take_along_axis(center_colors, faces, axis=1)
+    return facelets
+
+
+def cubies_to_coordinates(cp, co, ep, eo):
+    coordinates = {
+        'CO': rank_orientations(co, 3),
+        'EO': rank_orientations(eo, 2),
+        'CP': rank_permutations(cp),
+        'EP': rank_permutations(ep),
+    }
+    for name, subset in edge_subsets.items():
+        coordinates[name] = rank_edge_subsets(ep, subset)
+    return coordinates
+
+
+# returns the coordinates of facelet arrays (N, 54) as a dict of arrays
+def facelets_to_coordinates(facelets):
+    return cubies_to_coordinates(*facelets_to_cubies(facelets))
+
+
+# rebuilds facelet arrays from coordinates, the edge permutation comes from 'EP' or from the three edge subsets
+def coordinates_to_facelets(coordinates: dict, center_colors):
+    co = unrank_orientations(np.atleast_1d(coordinates['CO']), 3, 8)
+    eo = unrank_orientations(np.atleast_1d(coordinates['EO']), 2, 12)
+    cp = unrank_permutations(np.atleast_1d(coordinates['CP']), 8)
+    if 'EP' in coordinates:
+        ep = unrank_permutations(np.atleast_1d(coordinates['EP']), 12)
+    else:
+        ep = np.full((len(cp), 12), -1, dtype=np.intp)
+        for name, subset in edge_subsets.items():
+            partial = unrank_edge_subsets(np.atleast_1d(coordinates[name]), subset)
+            ep = np.where(partial >= 0, partial, ep)
+    return cubies_to_facelets(cp, co, ep, eo, center_colors)
+
+
+# a cube stored as coordinates, every face turn updates each coordinate with one table lookup
+class CoordinateCube:
+    table_names = ['CO', 'EO', 'CP', 'slice', 'U_edges', 'D_edges']
+
+    def __init__(self, cube: Cube.Cube = None):
+        if cube is None:
+            cube = Cube.Cube()
+        self.center_colors = cube.facelets[center_facelets].copy()
+        coordinates = facelets_to_coordinates(cube.facelets)
+        self.coordinates = {name: int(coordinates[name][0]) for name in self.table_names}
+        self.tables = {name: get_move_table(name) for name in self.table_names}
+
+    def move(self, move: str, magnitude: int):
+        if magnitude % 4 == 0:
+            return
+        move_index = coordinate_move_index[move + str(magnitude % 4)]
+        for name, table in self.tables.items():
+            self.coordinates[name] = int(table[self.coordinates[name], move_index])
+
+    # perform a string of face turns, raises ValueError for moves that move the centers
+    def do_moves(self, move_str: str):
+        parsed, moves, _ = Cube.compile_moves(move_str)
+        for move in moves:
+            if move[0] not in Cube.face_keys:
+                raise ValueError("coordinates only support face turns, not " + move[0])
+        for move in moves:
+            self.move(move[0], move[1])
+        return parsed
+
+    # full edge permutation coordinate (0..12!-1), rebuilt from the edge subset coordinates
+    def get_EP(self):
+        ep = np.full((1, 12), -1, dtype=np.intp)
+        for name, subset in edge_subsets.items():
+            partial = unrank_edge_subsets([self.coordinates[name]], subset)
+            ep = np.where(partial >= 0, partial, ep)
+        return int(rank_permutations(ep)[0])
+
+    def get_facelets(self):
+        return coordinates_to_facelets(self.coordinates, self.center_colors)[0]
+
+    def to_cube(self):
+        cube = Cube.Cube()
+        cube.set_state(self.get_facelets())
+        return cube
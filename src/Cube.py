@@ -1,8 +1,9 @@
 import numpy as np
-from PIL import Image
-import requests
-from io import BytesIO
-import copy
+from collections.abc import MutableMapping
+from types import MappingProxyType
+import functools
+import warnings
+import re
 
 face_keys = ['U', 'R', 'F', 'D', 'L', 'B']
 slice_keys = ['E', 'M', 'S']
@@ -12,100 +13,425 @@ all_keys = face_keys + slice_keys + axis_keys
 move_to_axis = dict(zip(all_keys, axis_keys + axis_keys + axis_keys + axis_keys))
 valid_moves = all_keys + [key.lower() for key in all_keys]
 
+# format: U, R, F, D, L, B
+default_colors = ['w', 'r', 'g', 'y', 'o', 'b']
+
+# index of each face or slice along its axis
+slice_to_index = {
+    'U': 0,
+    'E': 1,
+    'D': 2,
+    'L': 0,
+    'M': 1,
+    'R': 2,
+    'F': 0,
+    'S': 1,
+    'B': 2
+}
+
+axis_to_slices = {
+    'X': ['L', 'M', 'R'],
+    'Y': ['U', 'E', 'D'],
+    'Z': ['F', 'S', 'B']
+}
+
+# position of each axis in the (Y, X, Z) coordinates of a piece
+axis_to_dim = {'Y': 0, 'X': 1, 'Z': 2}
+
+# standard indexing over faces for visualization
+std_face_mapping = {
+    'U': ('Z', 'X'),
+    'R': ('Y', 'Z'),
+    'F': ('Y', 'X'),
+    'D': ('Z', 'X'),
+    'L': ('Y', 'Z'),
+    'B': ('Y', 'X'),
+}
+
+# maps axis of a move to the faces where the natural order of facelets has to be reversed
+move_facelet_order_change = MappingProxyType({
+    'Y': ('R', 'F'),
+    'X': ('F', 'D'),
+    'Z': ('D', 'L')
+})
+
+# moves that turn in the same direction as the "positive" rotation of their axis
+positive_moves = ['R', 'D', 'B', 'E', 'X']
+
+# outward normals of the faces in world coordinates, with x pointing to R, y to U and z to F
+face_normals = {
+    'U': (0, 1, 0),
+    'R': (1, 0, 0),
+    'F': (0, 0, 1),
+    'D': (0, -1, 0),
+    'L': (-1, 0, 0),
+    'B': (0, 0, -1),
+}
+
+
+# a move is a move letter directly followed by at most one prime or digit
+# spaces and primes that do not follow a move letter separate moves, anything else is an error
+move_token = re.compile("[ ']*([" + ''.join(valid_moves) + "])(['0-9]?)")
+move_separators = re.compile("[ ']*")
+valid_move_string = re.compile("(?:[ ']*[" + ''.join(valid_moves) + "]['0-9]?)*[ ']*")
+suffix_magnitude = {'': 1, "'": 3, **{str(digit): digit for digit in range(10)}}
+
+
+# error raised for a string of moves that can not be parsed
+# column is the 0-based position of the first invalid character, moves are the moves parsed before it
+class MoveSyntaxError(ValueError):
+    def __init__(self, move_str: str, column: int, moves: list):
+        self.move_str = move_str
+        self.column = column
+        self.moves = moves
+        super().__init__("invalid character %r at column %d:\n%s\n%s^" % (move_str[column], column, move_str, ' ' * column))
+
+
+# returns the list of moves of form [[move, magnitude], ...], raises MoveSyntaxError if parsing fails
+def tokenize_moves(move_str: str):
+    if valid_move_string.fullmatch(move_str):
+        return [[move, suffix_magnitude[suffix]] for move, suffix in move_token.findall(move_str)]
+    # locate the error: take moves as long as they match, the first character after them is invalid
+    moves = []
+    position = 0
+    match = move_token.match(move_str, position)
+    while match:
+        moves.append([match.group(1), suffix_magnitude[match.group(2)]])
+        position = match.end()
+        match = move_token.match(move_str, position)
+    raise MoveSyntaxError(move_str, move_separators.match(move_str, position).end(), moves)
+
 
 # Return True and list of moves if parsing is successful
 # Returns False and all the moves that could be performed until the parsing error
 def parse_moves(move_str: str):
-    move_list = []
-    last_letter = ' '
-    move_str += ' '
-    for letter in move_str:
-        if last_letter in valid_moves:
-            move_list.append([last_letter, 1])
-            if letter == "'":
-                move_list[-1][1] = 3
-            elif letter.isdigit():
-                move_list[-1][1] = int(letter)
-            last_letter = letter
-        elif last_letter == "'" or last_letter.isdigit() or last_letter == ' ':
-            if letter == ' ' or letter in valid_moves or letter == "'":
-                last_letter = letter
-            else:
-                return False, move_list
-        else:
-            return False, move_list
-    return True, move_list
+    try:
+        return True, tokenize_moves(move_str)
+    except MoveSyntaxError as error:
+        return False, error.moves
 
 
 def get_adj_faces(move: str):
     return [face for face in face_keys if move_to_axis[face] != move_to_axis[move]]
 
 
+# lists the (Y, X, Z, face) coordinates of all 54 facelets
+# facelets are ordered like the Visual Cube 'fc' string: U, R, F, D, L, B faces, 9 facelets each
+def init_facelet_coords():
+    facelet_coords = []
+    for face in face_keys:
+        # set the correct range "directions" for rows and columns of different faces
+        row_range = col_range = [0, 1, 2]
+        if face == 'U':
+            row_range = [2, 1, 0]
+        if face == 'L' or face == 'B':
+            col_range = [2, 1, 0]
+        axes = std_face_mapping[face]
+        index_dict = {move_to_axis[face]: slice_to_index[face], axes[0]: 0, axes[1]: 0}
+        for row in row_range:
+            for col in col_range:
+                index_dict[axes[0]] = row
+                index_dict[axes[1]] = col
+                facelet_coords.append((index_dict['Y'], index_dict['X'], index_dict['Z'], face))
+    return facelet_coords
+
+
+facelet_coords = init_facelet_coords()
+
+# maps piece coordinates (Y, X, Z) to a dict of form {face: facelet index}
+coords_to_facelets = dict()
+for facelet_index, (y, x, z, face) in enumerate(facelet_coords):
+    coords_to_facelets.setdefault((y, x, z), dict())[face] = facelet_index
+
+# used to access pieces by their letter strings (e.g. "UFR", "UF", "U")
+string_to_index = {frozenset(faces.keys()): list(coords) for coords, faces in coords_to_facelets.items()}
+
+
+# the template every new Cube starts from: read-only and shared, so a new cube only copies 54 bytes
+# PIL and requests are imported by viscube_image when it needs them, not when this module is loaded
+default_color_scheme = MappingProxyType(dict(zip(face_keys, default_colors)))
+solved_facelets = np.repeat(np.frombuffer(''.join(default_colors).encode('ascii'), dtype=np.uint8), 9)
+solved_facelets.setflags(write=False)
+
+
+# precomputes every move in valid_moves as a permutation of facelet indices
+# returns a dict of form {move: array of shape (4, 54)}, where row i is the move applied i times
+# applying a move is a gather: new_facelets = facelets[move_tables[move][magnitude % 4]]
+def init_move_tables():
+    # each facelet is described by the centered position of its piece and the normal of its face
+    positions = np.array([[y - 1, x - 1, z - 1] for y, x, z, _ in facelet_coords])
+    normals = np.zeros((54, 3), dtype=int)
+    for facelet_index, (_, _, _, face) in enumerate(facelet_coords):
+        normals[facelet_index, axis_to_dim[move_to_axis[face]]] = slice_to_index[face] - 1
+    sticker_to_index = {tuple(2 * p + n): i for i, (p, n) in enumerate(zip(positions, normals))}
+
+    move_tables = dict()
+    identity = np.arange(54)
+    for move in valid_moves:
+        axis = move_to_axis[move.upper()]
+        if move.upper() in axis_keys:           # rotations
+            layers = [0, 1, 2]
+        elif move.upper() in slice_keys:        # slice moves
+            layers = [1]
+        else:                                   # regular and wide moves
+            layers = [slice_to_index[move]] if move.isupper() else [slice_to_index[move.upper()], 1]
+        dim = axis_to_dim[axis]
+        dim_a, dim_b = [d for d in range(3) if d != dim]
+        direction = 1 if move.upper() in positive_moves else -1
+        if axis == 'X':     # the (Y, Z) plane is left-handed in (Y, X, Z) coordinates
+            direction = -direction
+
+        # quarter turn of the selected layers
+        turned = np.isin(positions[:, dim] + 1, layers)
+        quarter_turn = identity.copy()
+        for i in np.nonzero(turned)[0]:
+            sticker = 2 * positions[i] + normals[i]
+            new_sticker = sticker.copy()
+            new_sticker[dim_a] = -direction * sticker[dim_b]
+            new_sticker[dim_b] = direction * sticker[dim_a]
+            quarter_turn[sticker_to_index[tuple(new_sticker)]] = i
+
+        table = np.empty((4, 54), dtype=np.intp)
+        table[0] = identity
+        for magnitude in range(1, 4):
+            table[magnitude] = table[magnitude - 1][quarter_turn]
+        table.setflags(write=False)
+        move_tables[move] = table
+    return move_tables
+
+
+move_tables = init_move_tables()
+
+# maximum number of compiled algorithms kept by compile_moves
+compile_cache_size = 4096
+space_run = re.compile(' +')
+
+
+# composes a list of moves of form [[move, magnitude], ...] into one net facelet permutation
+def compose_moves(moves):
+    permutation = np.arange(54)
+    for move in moves:
+        permutation = permutation[move_tables[move[0]][move[1] % 4]]
+    return permutation
+
+
+# runs of spaces are collapsed so that equivalent spellings of an algorithm share one cache entry
+def normalize_moves(move_str: str):
+    if '  ' in move_str or move_str[:1] == ' ' or move_str[-1:] == ' ':
+        return space_run.sub(' ', move_str).strip(' ')
+    return move_str
+
+
+@functools.lru_cache(maxsize=compile_cache_size)
+def compile_normalized_moves(move_str: str):
+    parsed, moves = parse_moves(move_str)
+    permutation = compose_moves(moves)
+    permutation.setflags(write=False)
+    return parsed, tuple(tuple(move) for move in moves), permutation
+
+
+# compiles a string of moves into a single facelet permutation
+# returns the parse status, the parsed moves and the permutation (of the moves parsed before an error, if any)
+# results are kept in a bounded LRU cache keyed by the normalized move string
+def compile_moves(move_str: str):
+    return compile_normalized_moves(normalize_moves(move_str))
+
+
+# returns hits, misses, maxsize and currsize of the compile_moves cache
+def compile_cache_info():
+    return compile_normalized_moves.cache_info()
+
+
+def compile_cache_clear():
+    compile_normalized_moves.cache_clear()
+
+
+# returns the facelet array (54 color codes) of a 3x3x3 array of pieces of form {face: color}, such as Cube.pieces
+def pieces_to_facelets(pieces: np.ndarray):
+    facelets = np.empty(54, dtype=np.uint8)
+    for coords, face_to_facelet in coords_to_facelets.items():
+        for face, facelet in face_to_facelet.items():
+            facelets[facelet] = ord(pieces[coords][face])
+    return facelets
+
+
+# True for a 3x3x3 array of pieces such as Cube.pieces, the mask and state type before facelet arrays
+def is_piece_array(array):
+    return type(array) == np.ndarray and array.shape == (3, 3, 3)
+
+
+def warn_piece_array(name: str, stacklevel=3):
+    warnings.warn("passing a piece array as %s is deprecated, pass a facelet array from get_state() instead" % name,
+                  DeprecationWarning, stacklevel=stacklevel)
+
+
+# returns a mask or state array as a facelet array: a deprecated piece array is converted (with a warning),
+# any other array that is not 54 color codes raises TypeError
+def to_facelets(array: np.ndarray, name='mask', stacklevel=3):
+    if is_piece_array(array):
+        warn_piece_array(name, stacklevel + 1)
+        return pieces_to_facelets(array)
+    if array.shape != (54,) or array.dtype != np.uint8:
+        raise TypeError("%s must be a facelet array of 54 uint8 color codes (or a 3x3x3 piece array), got %s %s"
+                        % (name, array.dtype, array.shape))
+    return array
+
+
+# a dict-like view of a single piece of the form {face: color}
+# reads and writes go straight through to the underlying facelet array
+# cube is the Cube owning the facelets, if any: writes are then recorded in its journal like set_piece_color
+class PieceView(MutableMapping):
+    def __init__(self, facelets: np.ndarray, face_to_facelet: dict, cube=None):
+        self.facelets = facelets
+        self.face_to_facelet = face_to_facelet
+        self.cube = cube
+
+    def __getitem__(self, face):
+        return chr(self.facelets[self.face_to_facelet[face]])
+
+    def __setitem__(self, face, color):
+        before = self.cube.snapshot() if self.cube is not None and self.cube.checkpoints else None
+        self.facelets[self.face_to_facelet[face]] = ord(color)
+        if before is not None:
+            self.cube.record(('state', before, self.cube.snapshot()))
+
+    def __delitem__(self, face):
+        raise TypeError("facelets of a piece cannot be removed")
+
+    def __iter__(self):
+        return iter(self.face_to_facelet)
+
+    def __len__(self):
+        return len(self.face_to_facelet)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
 class Cube:
     def __init__(self, scheme_name: str = None, verbose=False):
-        self.slice_to_index = {
-            'U': 0,
-            'E': 1,
-            'D': 2,
-            'L': 0,
-            'M': 1,
-            'R': 2,
-            'F': 0,
-            'S': 1,
-            'B': 2
-        }
-
-        #
-        self.axis_to_slices = {
-            'X': ['L', 'M', 'R'],
-            'Y': ['U', 'E', 'D'],
-            'Z': ['F', 'S', 'B']
-        }
+        self.slice_to_index = slice_to_index
+        self.axis_to_slices = axis_to_slices
 
         # standard indexing over faces for visualization
-        self.std_face_mapping = {
-            'U': ('Z', 'X'),
-            'R': ('Y', 'Z'),
-            'F': ('Y', 'X'),
-            'D': ('Z', 'X'),
-            'L': ('Y', 'Z'),
-            'B': ('Y', 'X'),
-        }
-
-        # maps axis of a move to the faces where the natural order of facelets has to be reversed
-        self.move_facelet_order_change = {
-            'Y': ('R', 'F'),
-            'X': ('F', 'D'),
-            'Z': ('D', 'L')
-        }
+        self.std_face_mapping = std_face_mapping
+
+        self.move_facelet_order_change = move_facelet_order_change
         self.color_schemes = self.init_css()
         self.colors = self.set_colors(scheme_name)  # active color scheme
-        self.pieces = self.init_pieces(verbose)
-        # the format is YXZ instead of XYZ is because numpy arrays are row-first, and rows are specified by Y-axis
-        self.slices = {    # Y, X, Z
-            'U': self.pieces[0, :, :],
-            'E': self.pieces[1, :, :],
-            'D': self.pieces[2, :, :],
-            'L': self.pieces[:, 0, :],
-            'M': self.pieces[:, 1, :],
-            'R': self.pieces[:, 2, :],
-            'F': self.pieces[:, :, 0],
-            'S': self.pieces[:, :, 1],
-            'B': self.pieces[:, :, 2]
-        }
-        self.string_to_index = dict()       # used to access pieces by their letter strings (e.g. "UFR", "UF", "U")
-        for y in range(3):
-            for x in range(3):
-                for z in range(3):
-                    if not (y == 1 and x == 1 and z == 1):
-                        self.string_to_index[frozenset(self.pieces[y, x, z].keys())] = [y, x, z]
+        # one uint8 character code per sticker, in the order of the Visual Cube 'fc' string
+        self.facelets = self.init_facelets(verbose)
+        self.string_to_index = string_to_index      # used to access pieces by their letter strings
+
+        # move journal, only recorded while at least one checkpoint is pushed
+        # entries are ('permutation', permutation) or ('state', snapshot before, snapshot after)
+        self.journal = []
+        self.redo_stack = []
+        self.checkpoints = []     # journal lengths at the time each checkpoint was pushed
+
+    # the format is YXZ instead of XYZ is because numpy arrays are row-first, and rows are specified by Y-axis
+    # 3x3x3 array of piece views over self.facelets, the core piece is None
+    @property
+    def pieces(self):
+        pieces = np.empty((3, 3, 3), dtype=object)
+        for coords, face_to_facelet in coords_to_facelets.items():
+            pieces[coords] = PieceView(self.facelets, face_to_facelet, self)
+        return pieces
 
+    @property
+    def slices(self):
+        pieces = self.pieces
+        slices = dict()
+        for axis, slice_letters in self.axis_to_slices.items():
+            for slice_letter in slice_letters:
+                index = [slice(None)] * 3
+                index[axis_to_dim[axis]] = self.slice_to_index[slice_letter]
+                slices[slice_letter] = pieces[tuple(index)]
+        return slices
+
+    # returns a writable copy of the facelet array (54 bytes)
     def get_state(self):
-        state = copy.deepcopy(self.pieces)
+        state = self.facelets.copy()
         return state
 
-    def set_state(self, state: np.ndarray):
-        self.pieces = copy.deepcopy(state)
+    # copies a state into the existing facelet array, so piece views stay valid
+    # state can be an array from get_state or a snapshot from snapshot() (a piece array is deprecated)
+    def set_state(self, state):
+        if type(state) == bytes:
+            state = np.frombuffer(state, dtype=np.uint8)
+        elif type(state) == np.ndarray:
+            state = to_facelets(state, 'state')
+        before = self.snapshot() if self.checkpoints else None
+        self.facelets[:] = state
+        if before is not None:
+            self.record(('state', before, self.snapshot()))
+
+    # returns an immutable, hashable snapshot of the state
+    def snapshot(self):
+        return self.facelets.tobytes()
+
+    def restore(self, snapshot: bytes):
+        self.set_state(snapshot)
+
+    # adds an entry to the move journal if a checkpoint is active
+    def record(self, entry: tuple):
+        if self.checkpoints:
+            self.journal.append(entry)
+            self.redo_stack.clear()
+
+    # starts recording moves and edits so they can be rolled back later
+    # checkpoints can be nested, returns the number of active checkpoints
+    def push_checkpoint(self):
+        self.checkpoints.append(len(self.journal))
+        return len(self.checkpoints)
+
+    # undoes everything done since the last checkpoint and removes that checkpoint
+    # returns the number of undone journal entries
+    def rollback(self):
+        if not self.checkpoints:
+            return 0
+        undone = 0
+        while len(self.journal) > self.checkpoints[-1]:
+            self.undo()
+            undone += 1
+        self.checkpoints.pop()
+        if not self.checkpoints:
+            self.journal.clear()
+        return undone
+
+    # removes the last checkpoint while keeping the current state
+    def pop_checkpoint(self):
+        if self.checkpoints:
+            self.checkpoints.pop()
+        if not self.checkpoints:
+            self.journal.clear()
+            self.redo_stack.clear()
+
+    # undoes the last journal entry, never going back past the last checkpoint
+    # returns False if there is nothing to undo
+    def undo(self):
+        if not self.checkpoints or len(self.journal) == self.checkpoints[-1]:
+            return False
+        entry = self.journal.pop()
+        if entry[0] == 'permutation':
+            self.facelets[entry[1]] = self.facelets.copy()
+        else:
+            self.facelets[:] = np.frombuffer(entry[1], dtype=np.uint8)
+        self.redo_stack.append(entry)
+        return True
+
+    # redoes the last undone journal entry, returns False if there is nothing to redo
+    def redo(self):
+        if not self.redo_stack:
+            return False
+        entry = self.redo_stack.pop()
+        if entry[0] == 'permutation':
+            self.facelets[:] = self.facelets[entry[1]]
+        else:
+            self.facelets[:] = np.frombuffer(entry[2], dtype=np.uint8)
+        if self.checkpoints:
+            self.journal.append(entry)
+        return True
 
     # set cube colors according to a color scheme
     def set_colors(self, scheme_name):
@@ -118,11 +444,7 @@ class Cube:
     # initialize Color SchemeS
     # misleading name is misleading
     def init_css(self):
-        # format: U, R, F, D, L, B
-        default_colors = ['w', 'r', 'g', 'y', 'o', 'b']
-        color_schemes = dict()
-        color_schemes['default'] = dict(zip(face_keys, default_colors))
-        return color_schemes
+        return {'default': default_color_scheme}
 
     # adds a new color scheme or overwrites an existing one
     # returns True if successful
@@ -133,137 +455,104 @@ class Cube:
         else:
             return False
 
-    # generates all the pieces according to the active color scheme
-    def init_pieces(self, verbose):
-        pieces = np.empty((3, 3, 3), dtype=dict)
-
-        # set color of each center according to the active color scheme
-        if verbose: print("Centers:")
-        for face in face_keys:
-            face_axis = move_to_axis[face]
-            remaining_axes = axis_keys.copy()
-            remaining_axes.remove(face_axis)
-            center_coords = {face_axis: self.slice_to_index[face], remaining_axes[0]: 1, remaining_axes[1]: 1}
-            pieces[center_coords['Y'], center_coords['X'], center_coords['Z']] = {face: self.colors[face]}
-            if verbose:
-                print("CENTER:", face, "\t\tAXIS:", face_axis, "\t\tCOORDS:", center_coords)
-
-        # generate edges - unordered pairs of adjacent faces
-        m_faces = ['U', 'F', 'D', 'B']
-        edges = []
-        for m_face in m_faces:
-            for side_face in ['R', 'L']:
-                edges.append([m_face, side_face])
-        for m_edge in [['U', 'F'], ['U', 'B'], ['D', 'F'], ['D', 'B']]:
-            edges.append(m_edge)
-        # print("EDGES:", edges)
-
-        # set colors of each edge according to the active color scheme
-        if verbose: print("\nEdges:")
-        for edge in edges:
-            edge_axes = [move_to_axis[edge[0]], move_to_axis[edge[1]]]
-            # print("ALL AXES:", plane_keys, "\t\tEDGE AXES:", edge_axes)
-            remaining_axis = (set(axis_keys) - set(edge_axes)).pop()
-            # print("REMAINING AXIS:", remaining_axis)
-            edge_coords = {edge_axes[0]: self.slice_to_index[edge[0]], edge_axes[1]: self.slice_to_index[edge[1]],
-                           remaining_axis: 1}
-            pieces[edge_coords['Y'], edge_coords['X'], edge_coords['Z']] = dict(
-                zip(edge, [self.colors[face] for face in edge]))
-            if verbose:
-                print("EDGE PAIR:", edge, "\t\tAXES:", edge_axes, "\t\tCOORDS:", edge_coords)
-
-        # generate corners - unordered triplets of adjacent faces
-        corners = [(x, y, z) for x in ['U', 'D'] for y in ['F', 'B'] for z in ['R', 'L']]
-        # print("CORNERS:", corners)
-
-        # set colors of each corner according to the active color scheme
-        if verbose: print("\nCorners:")
-        for corner in corners:
-            corner_axes = [move_to_axis[corner[0]], move_to_axis[corner[1]], move_to_axis[corner[2]]]
-            corner_coords = {corner_axes[0]: self.slice_to_index[corner[0]],
-                             corner_axes[1]: self.slice_to_index[corner[1]],
-                             corner_axes[2]: self.slice_to_index[corner[2]]}
-            pieces[corner_coords['Y'], corner_coords['X'], corner_coords['Z']] = dict(
-                zip(corner, [self.colors[face] for face in corner]))
-            if verbose: print("CORNER TRIPLE:", corner, "\t\tAXES:", corner_axes, "\t\tCOORDS:", corner_coords)
+    # generates all the facelets according to the active color scheme
+    def init_facelets(self, verbose):
+        if self.colors is default_color_scheme:
+            facelets = solved_facelets.copy()
+        else:
+            facelets = np.empty(54, dtype=np.uint8)
+            for i, face in enumerate(face_keys):
+                facelets[9 * i: 9 * i + 9] = ord(self.colors[face])
 
         if verbose:
-            print("\nAll Pieces:")
+            print("All Pieces:")
             pid = 0
             for y in range(3):
                 for x in range(3):
                     for z in range(3):
                         if not (y == 1 and x == 1 and z == 1):
-                            print(pid, ": ", pieces[y, x, z])
+                            print(pid, ": ", PieceView(facelets, coords_to_facelets[(y, x, z)]), "\t\tCOORDS:", [y, x, z])
                             pid += 1
-        return pieces
+        return facelets
+
+    # returns the coordinates (Y, X, Z) of a piece given in any of the formats accepted by get_piece
+    def get_piece_coords(self, piece_keys):
+        if type(piece_keys) == str or (type(piece_keys) == list and type(piece_keys[0]) == str):
+            return tuple(self.string_to_index[frozenset(piece_keys)])
+        elif type(piece_keys) == dict:
+            return piece_keys['Y'], piece_keys['X'], piece_keys['Z']
+        elif type(piece_keys) == list:
+            return piece_keys[0], piece_keys[1], piece_keys[2]
+        else:
+            return None
 
-    # returns the value of a piece as a dictionary of format {face: color}
+    # returns the value of a piece as a dict-like view of format {face: color}
     # piece_keys can be a string representing an intersection of faces (e.g. "RUF")
     # piece_keys can also be a dictionary mapping axes to indices of a piece within the 3x3x3 array self.pieces
     # piece_keys can also be a list of indices or of letters
+    # mask is a facelet array (e.g. from get_state) to read instead of the cube's state; the 3x3x3 piece array of
+    # self.pieces is still accepted for it but deprecated
     def get_piece(self, piece_keys, mask=None):
-        pieces = self.pieces
+        facelets = self.facelets
         if type(mask) == np.ndarray:
-            pieces = mask
-        if type(piece_keys) == str or (type(piece_keys) == list and type(piece_keys[0]) == str):
-            index = self.string_to_index[frozenset(piece_keys)]
-            return pieces[index[0], index[1], index[2]]
-        elif type(piece_keys) == dict:
-            return pieces[piece_keys['Y'], piece_keys['X'], piece_keys['Z']]
-        elif type(piece_keys) == list:
-            return pieces[piece_keys[0], piece_keys[1], piece_keys[2]]
-        else:
+            facelets = mask
+        coords = self.get_piece_coords(piece_keys)
+        if coords is None:
             return None
+        # a piece array is read and written through its own pieces
+        if is_piece_array(facelets):
+            warn_piece_array('mask')
+            return facelets[coords]
+        return PieceView(to_facelets(facelets), coords_to_facelets[coords], self if facelets is self.facelets else None)
 
     # sets ALL facelet values of a specified piece
     def set_piece(self, piece_keys, piece: dict):
-        if type(piece_keys) == str or (type(piece_keys) == list and type(piece_keys[0]) == str):
-            index = self.string_to_index[frozenset(piece_keys)]
-            self.pieces[index[0], index[1], index[2]] = piece
-        elif type(piece_keys) == dict:
-            self.pieces[piece_keys['Y'], piece_keys['X'], piece_keys['Z']] = piece
-        elif type(piece_keys) == list:
-            self.pieces[piece_keys[0], piece_keys[1], piece_keys[2]] = piece
+        self.set_piece_facelets(piece_keys, piece)
 
     # sets only the specified facelet values of a specified piece
     def set_piece_facelets(self, piece_keys, piece: dict, mask=None):
-        pieces = self.pieces
-        if type(mask) == np.ndarray:
-            pieces = mask
-        if type(piece_keys) == str or (type(piece_keys) == list and type(piece_keys[0]) == str):
-            index = self.string_to_index[frozenset(piece_keys)]
-            for facelet in piece.keys():
-                pieces[index[0], index[1], index[2]][facelet] = piece[facelet]
-        elif type(piece_keys) == dict:
-            for facelet in piece.keys():
-                print(facelet)
-                pieces[piece_keys['Y'], piece_keys['X'], piece_keys['Z']][facelet] = piece[facelet]
-        elif type(piece_keys) == list:
-            for facelet in piece.keys():
-                pieces[piece_keys[0], piece_keys[1], piece_keys[2]][facelet] = piece[facelet]
+        self.write_piece_facelets(piece_keys, piece, mask, 4)
 
     # set colors of piece(s) sticker-by-sticker
     # takes a dict of form: {facelet: color}
     def set_piece_colors(self, piece_colors: dict, mask=None):
-        pieces = self.pieces
-        if type(mask) == np.ndarray:
-            pieces = mask
-        index = self.string_to_index[frozenset(piece_colors.keys())]
-        for facelet in piece_colors.keys():
-            pieces[index[0], index[1], index[2]][facelet] = piece_colors[facelet]
+        self.write_piece_facelets(list(piece_colors.keys()), piece_colors, mask, 4)
+
+    # stacklevel points the deprecation warning of a piece array mask at the caller of the public method
+    def write_piece_facelets(self, piece_keys, piece: dict, mask, stacklevel: int):
+        before = self.snapshot() if self.checkpoints and type(mask) != np.ndarray else None
+        coords = self.get_piece_coords(piece_keys)
+        if is_piece_array(mask):
+            warn_piece_array('mask', stacklevel)
+            piece_view = mask[coords]
+        else:
+            # a view without the cube, the whole edit is recorded once below
+            facelets = to_facelets(mask) if type(mask) == np.ndarray else self.facelets
+            piece_view = PieceView(facelets, coords_to_facelets[coords])
+        for facelet in piece.keys():
+            piece_view[facelet] = piece[facelet]
+        if before is not None:
+            self.record(('state', before, self.snapshot()))
 
     # TO DO: change method so piece_keys can be multiple types (list, string, dict, etc)
     # set color of an entire piece
     def set_piece_color(self, piece_keys: list, color_str, mask=None, verbose=False):
-        pieces = self.pieces
+        facelets = self.facelets
         if type(mask) == np.ndarray:
-            pieces = mask
-        new_colors = dict.fromkeys(piece_keys, color_str)
-        index = self.string_to_index[frozenset(piece_keys)]
-        pieces[index[0], index[1], index[2]] = new_colors
+            facelets = mask
+        before = self.snapshot() if self.checkpoints and facelets is self.facelets else None
+        coords = tuple(self.string_to_index[frozenset(piece_keys)])
+        face_to_facelet = coords_to_facelets[coords]
+        if is_piece_array(facelets):
+            warn_piece_array('mask')
+            for face in face_to_facelet:
+                facelets[coords][face] = color_str
+        else:
+            to_facelets(facelets)[list(face_to_facelet.values())] = ord(color_str)
+        if before is not None:
+            self.record(('state', before, self.snapshot()))
         if verbose:
-            print("changed", piece_keys, " to", new_colors)
+            print("changed", piece_keys, " to", dict.fromkeys(piece_keys, color_str))
 
     # UNUSED METHOD
     # returns a dict of piece groups for a given slice
@@ -297,7 +586,6 @@ class Cube:
     # piece groups keys: 'centers', 'edges', 'corners'
     # piece groups values: lists of pieces
     def get_sorted_piece_groups(self, move: str):
-        slice_pieces = self.slices[move]
         piece_groups = {'centers': [], 'edges': [], 'corners': []}
         adj_faces = get_adj_faces(move)
         if self.slice_to_index[move] == 1:  # inner slice
@@ -315,7 +603,6 @@ class Cube:
                 piece_groups['corners'].append(self.get_piece(piece_letters))
         return piece_groups
 
-    # TO DO: move the code block into move() where it is called and make more efficient
     # returns a dict of piece groups for a given slice
     # each piece group lists are sorted by adjacency of pieces:
     #   meaning consecutive pieces in a group are 'adjacent' to each other
@@ -324,62 +611,40 @@ class Cube:
     # these groups don't necessarily contain those types of pieces though
     # e.g. M slice: 'corners': UF, DF, DB, UB,  'edges': U, F, D, B
     def get_slice_groups(self, move: str):
-        slice_pieces = self.slices[move]
         piece_groups = {'edges': [], 'corners': []}
         adj_faces = get_adj_faces(move)
         base_letters = []
         if self.slice_to_index[move] != 1:  # outer slice
             base_letters.append(move)
         for i in range(len(adj_faces)):
-            piece_letters = copy.deepcopy(base_letters)
-            piece_letters.append(adj_faces[i])
+            piece_letters = base_letters + [adj_faces[i]]
             piece_groups['edges'].append(self.get_piece(piece_letters))
             piece_letters.append(adj_faces[(i + 1) % len(adj_faces)])
             piece_groups['corners'].append(self.get_piece(piece_letters))
         return piece_groups
 
-    # move performed piecewise
+    # move performed as a single gather over the facelet array using the precomputed move tables
     def move(self, move: str, magnitude: int):
-        moved_slices = []
+        self.apply_permutation(move_tables[move][magnitude % 4])
 
-        # find indices of slices that will be affected
-        if move.upper() in axis_keys:       # rotations
-            moved_slices = [0, 1, 2]
-        else:
-            if move.upper() in slice_keys:  # slice moves
-                moved_slices = [1]
-            else:                           # regular and wide moves
-                moved_slices.append(self.slice_to_index[move.upper()])
-                if move.islower():          # wide moves
-                    moved_slices.append(1)
-        move = move.upper()
-        adj_faces = get_adj_faces(move)
-        num_faces = len(adj_faces)      # should always be 4, but gotta generalize, lol
-        axis_of_rot = move_to_axis[move]
-        move_dir = num_faces - magnitude
-        if move in ['R', 'D', 'B', 'E', 'X']:
-           move_dir = magnitude
-        for moved_slice in moved_slices:
-            slice_letter = self.axis_to_slices[axis_of_rot][moved_slice]
-            piece_groups = self.get_slice_groups(slice_letter)
-            outer_slice = (moved_slice != 1)
-            for group_key in piece_groups.keys():
-                piece_group = piece_groups[group_key]
-                temp_group = copy.deepcopy(piece_group)
-                for i in range(len(piece_group)):
-                    i_from = (i + move_dir) % num_faces
-                    i2 = (i + 1) % num_faces
-                    i2_from = (i2 + move_dir) % num_faces
-                    # print(temp_group[i_from].keys(), ':\t', adj_faces[i_from], ':', temp_group[i_from][adj_faces[i_from]], '\t\t->\t\t', piece_group[i].keys(), ':\t', adj_faces[i], ':', piece_group[i][adj_faces[i]])
-                    piece_group[i][adj_faces[i]] = temp_group[i_from][adj_faces[i_from]]
-                    if group_key == 'corners':   # corners require mapping one extra sticker on adjacent
-                        piece_group[i][adj_faces[i2]] = temp_group[i_from][adj_faces[i2_from]]
-                    if outer_slice:              # outer slice pieces require mapping stickers on said outer slice
-                        piece_group[i][slice_letter] = temp_group[i_from][slice_letter]
+    # applies a facelet permutation, such as a compiled algorithm, as a single gather
+    def apply_permutation(self, permutation: np.ndarray):
+        self.facelets[:] = self.facelets[permutation]
+        if self.checkpoints:
+            self.record(('permutation', permutation))
 
     # perform a string of moves
-    def do_moves(self, move_str: str):
-        parsed, moves = parse_moves(move_str)
+    # the string is compiled (and cached) into one permutation, so it costs the same as a single move
+    # with simplify=True it is first simplified, so that equivalent spellings (e.g. "U U" and "U2") share a compiled entry
+    # with strict=True a string that can not be parsed raises MoveSyntaxError and no move is done,
+    # otherwise the error is printed and the moves before it are done
+    def do_moves(self, move_str: str, simplify=False, strict=False):
+        if simplify and compile_moves(move_str)[0]:
+            from src import Simplify
+            move_str = Simplify.simplify_moves(move_str)
+        parsed, moves, permutation = compile_moves(move_str)
+        if not parsed and strict:
+            tokenize_moves(move_str)
         if not parsed:
             print("Parsing failed after", end='   ')
             for move in moves:
@@ -390,34 +655,30 @@ class Cube:
                     print(str(move[1]), end='')
                 print(end=' ')
             print('')
-        for move in moves:
-            self.move(move[0], move[1])
+        self.apply_permutation(permutation)
 
-    def CMLL_affects_EO(self, CMLL: str, CMLLsetup: str, initial_EO: str, show_img=False):
+    # cache can be a RenderCache, in which case both images are rendered (or looked up) through it
+    # sticker_mask (a Mask.StickerMask) recolors both images under the EO colors, e.g. to hide the solved pieces
+    def CMLL_affects_EO(self, CMLL: str, CMLLsetup: str, initial_EO: str, show_img=False, cache=None,
+                        sticker_mask=None):
         self.do_moves(initial_EO)
         self.do_moves(CMLLsetup)
-        previous_state = copy.deepcopy(self.pieces)
+        previous_state = self.get_state()
         self.do_moves(CMLL)
-        # print(self.viscube_image(translucent=True, show_img=show_img, mask=previous_state))
-        # print(self.viscube_image(translucent=True, show_img=show_img))
-        LSE = ['UF', 'UR', 'UB', 'UL', 'DF', 'DB']
-        LSE_before = self.EO_mask(previous_state)
-        LSE_after =  self.EO_mask(self.pieces)
-        for edge_str in LSE:
-            previous_edge = self.get_piece(edge_str, previous_state)
-            current_edge = self.get_piece(edge_str)
-            if current_edge[edge_str[0]] == previous_edge[edge_str[0]] and current_edge[edge_str[1]] == previous_edge[edge_str[1]]:
-                LSE_before[edge_str] = 't'
-                LSE_after[edge_str] = 't'
-            self.set_piece_color([char for char in edge_str], LSE_before[edge_str], mask=previous_state)
-            self.set_piece_color([char for char in edge_str], LSE_after[edge_str])
-
-
-        url_before = self.viscube_image(translucent=True, show_img=show_img, mask=previous_state)
-        url_after = self.viscube_image(translucent=True, show_img=show_img)
+        # the EO colors are only applied when rendering, neither state is recolored
+        from src import Mask
+        mask_before, mask_after = Mask.EO_change_masks(previous_state, self.facelets)
+        if sticker_mask is not None:
+            mask_before, mask_after = sticker_mask.then(mask_before), sticker_mask.then(mask_after)
+        url_before = self.viscube_image(translucent=True, show_img=show_img, mask=previous_state, cache=cache,
+                                        sticker_mask=mask_before)
+        url_after = self.viscube_image(translucent=True, show_img=show_img, cache=cache, sticker_mask=mask_after)
         return url_before, url_after
 
+    # pieces is a facelet array such as get_state() or self.facelets (a piece array from self.pieces is deprecated)
     def EO_mask(self, pieces):
+        if type(pieces) == np.ndarray:
+            pieces = to_facelets(pieces, 'the state of EO_mask')
         LSE = ['UF', 'UR', 'UB', 'UL', 'DF', 'DB']
         mask = dict()
         for edge_str in LSE:
@@ -429,43 +690,33 @@ class Cube:
         return mask
 
     # returns the colors of the stickers on each side
-    def get_facelets(self, mask):
-        pieces = self.pieces
+    def get_facelets(self, mask, sticker_mask=None):
+        fc_string = self.get_facelets_string(mask, sticker_mask)
+        return {face: list(fc_string[9 * i: 9 * i + 9]) for i, face in enumerate(face_keys)}
+
+    # renders the cube locally in the same style as the Visual Cube API, without any network access
+    # returns an SVG string if fmt is 'svg', PNG bytes otherwise
+    def render(self, fmt='svg', size=200, translucent=False, mask=None, sticker_mask=None):
+        from src import Render
+        fc_string = self.get_facelets_string(mask, sticker_mask)
+        return Render.render(fc_string, size, 'trans' if translucent else None, fmt)
+
+    # returns the colors of all stickers as a Visual Cube 'fc' string
+    # mask is a state to show instead of the cube's, sticker_mask a Mask.StickerMask recoloring the shown state
+    def get_facelets_string(self, mask=None, sticker_mask=None):
+        facelets = self.facelets
         if type(mask) == np.ndarray:
-            pieces = mask
-
-        facelets = dict()
-        for face in face_keys:
-            face_facelets = []
-
-            # set the correct range "directions" for rows and columns of different faces
-            row_range = col_range = [0, 1, 2]
-            if face == 'U':
-                row_range = [2, 1, 0]
-            if face == 'L' or face == 'B':
-                col_range = [2, 1, 0]
-
-            # axes = axis_keys.copy()
-            # axes.remove(face_axes[face])  # axes[0] = i_axis, axes[1] = j_axis
-            axes = self.std_face_mapping[face]
-            index_dict = {move_to_axis[face]: self.slice_to_index[face], axes[0]: 0, axes[1]: 0}
-            # print(face, ":\trow", axes[0], "\tcol", axes[1])
-            for row in row_range:
-                for col in col_range:
-                    index_dict[axes[0]] = row
-                    index_dict[axes[1]] = col
-                    facelet_color = pieces[index_dict['Y']][index_dict['X']][index_dict['Z']][face]
-                    face_facelets.append(facelet_color)
-            facelets[face] = face_facelets
-        return facelets
+            facelets = to_facelets(mask, stacklevel=4)
+        if sticker_mask is not None:
+            facelets = sticker_mask.apply(facelets)
+        return facelets.tobytes().decode('ascii')
 
     # shows a 3D representation of the cube using Visual Cube API
-    def viscube_image(self, translucent=False, verbose=False, show_img=True, mask=None):
-        facelets: dict = self.get_facelets(mask=mask)
-        fc_string = ""
-        for face in face_keys:
-            for char in facelets[face]:
-                fc_string += char
+    # if local is True the image is rendered in-process instead of being fetched
+    # if cache is a RenderCache the image is taken from it (rendered into it on a miss), even when it is not shown
+    def viscube_image(self, translucent=False, verbose=False, show_img=True, mask=None, local=False, cache=None,
+                      sticker_mask=None):
+        fc_string = self.get_facelets_string(mask, sticker_mask)
         if verbose:
             print("Visual Cube string")
             for row in range(3):
@@ -481,8 +732,22 @@ class Cube:
         if translucent:
             url += "&view=trans"
         url += ('&fc=' + fc_string)
-        if show_img:
-            response = requests.get(url)
-            img = Image.open(BytesIO(response.content))
+        if cache is not None:
+            img_bytes = cache.get(fc_string, 150 if show_img else 200, 'trans' if translucent else None,
+                                  'png' if show_img else 'svg')
+            if show_img:
+                from PIL import Image
+                from io import BytesIO
+                Image.open(BytesIO(img_bytes)).show()
+        elif show_img:
+            if local:
+                from src import Render
+                img = Render.render_image(fc_string, 150, 'trans' if translucent else None)
+            else:
+                import requests
+                from PIL import Image
+                from io import BytesIO
+                response = requests.get(url)
+                img = Image.open(BytesIO(response.content))
             img.show()
         return url
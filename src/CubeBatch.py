@@ -0,0 +1,133 @@
+import numpy as np
+from src import Cube
+
+
+# returns the facelet indices of a piece given by its letters (e.g. "UF") as a dict of form {face: facelet index}
+def get_piece_facelets(piece_str):
+    return Cube.coords_to_facelets[tuple(Cube.string_to_index[frozenset(piece_str)])]
+
+
+# N cubes stored as an (N, 54) matrix of facelet color codes, one row per cube
+# rows use the same layout as Cube.facelets, so moves and compiled algorithms apply to all rows with one gather
+class CubeBatch:
+    def __init__(self, states: np.ndarray):
+        self.states = np.ascontiguousarray(states, dtype=np.uint8).reshape(-1, 54)
+
+    # a batch of n copies of a cube (solved by default)
+    @classmethod
+    def from_cube(cls, n: int, cube: Cube.Cube = None):
+        if cube is None:
+            cube = Cube.Cube()
+        return cls(np.tile(cube.facelets, (n, 1)))
+
+    @classmethod
+    def from_cubes(cls, cubes: list):
+        return cls(np.stack([cube.facelets for cube in cubes]))
+
+    def __len__(self):
+        return len(self.states)
+
+    def __getitem__(self, rows):
+        return CubeBatch(self.states[rows])
+
+    def copy(self):
+        return CubeBatch(self.states.copy())
+
+    # returns row i as a standalone Cube
+    def to_cube(self, i: int):
+        cube = Cube.Cube()
+        cube.set_state(self.states[i])
+        return cube
+
+    # applies a facelet permutation to every row
+    # permutation can be a single (54,) permutation or an (N, 54) matrix with one permutation per row
+    # the gather of all rows replaces the states array, so batches over read-only (e.g. memory-mapped) states work
+    def apply_permutation(self, permutation: np.ndarray, rows=None):
+        if rows is None:
+            if permutation.ndim == 1:
+                self.states = self.states[:, permutation]
+            else:
+                self.states = np.take_along_axis(self.states, permutation, axis=1)
+            return
+        if not self.states.flags.writeable:
+            self.states = self.states.copy()
+        if permutation.ndim == 1:
+            self.states[rows] = self.states[rows][:, permutation]
+        else:
+            self.states[rows] = np.take_along_axis(self.states[rows], permutation, axis=1)
+
+    def move(self, move: str, magnitude: int):
+        self.apply_permutation(Cube.move_tables[move][magnitude % 4])
+
+    # perform the same string of moves on every row
+    # returns True if parsing is successful
+    def do_moves(self, move_str: str):
+        parsed, moves, permutation = Cube.compile_moves(move_str)
+        self.apply_permutation(permutation)
+        return parsed
+
+    # perform a different string of moves on each row
+    # rows are grouped by algorithm so every distinct algorithm is compiled once and applied to its rows with one gather,
+    # without building a permutation per row
+    # returns a boolean array, False for rows whose algorithm failed to parse
+    def do_moves_per_row(self, move_strs: list):
+        algorithms, algorithm_index = np.unique(np.asarray(move_strs, dtype=object), return_inverse=True)
+        algorithm_index = algorithm_index.ravel()
+        parsed = np.empty(len(algorithms), dtype=bool)
+        if not self.states.flags.writeable:
+            self.states = self.states.copy()
+        # the rows of each algorithm, as consecutive runs of a stable sort
+        order = np.argsort(algorithm_index, kind='stable')
+        bounds = np.searchsorted(algorithm_index[order], np.arange(len(algorithms) + 1))
+        for i, algorithm in enumerate(algorithms):
+            parsed[i], _, permutation = Cube.compile_moves(algorithm)
+            rows = order[bounds[i]:bounds[i + 1]]
+            self.states[rows] = self.states[rows][:, permutation]
+        return parsed[algorithm_index]
+
+    # returns the states as an (N, 6, 9) array of color codes, faces in the order of Cube.face_keys
+    # sticker_mask is a Mask.StickerMask for one state or with one row per state, applied to a copy of the states
+    def get_facelets(self, mask=None, sticker_mask=None):
+        states = self.states
+        if type(mask) == np.ndarray:
+            states = mask
+        if sticker_mask is not None:
+            states = sticker_mask.apply(states)
+        return states.reshape(-1, 6, 9)
+
+    # Visual Cube 'fc' strings of all rows
+    def fc_strings(self, mask=None, sticker_mask=None):
+        facelets = self.get_facelets(mask, sticker_mask)
+        return [row.tobytes().decode('ascii') for row in facelets]
+
+    # returns a dict of form {edge: array of color codes}, 'y' for oriented and 'm' for misoriented edges
+    def EO_mask(self, states=None):
+        if states is None:
+            states = self.states
+        LSE = ['UF', 'UR', 'UB', 'UL', 'DF', 'DB']
+        mask = dict()
+        for edge_str in LSE:
+            colors = states[:, get_piece_facelets(edge_str)[edge_str[0]]]
+            oriented = (colors == ord('w')) | (colors == ord('y'))
+            mask[edge_str] = np.where(oriented, ord('y'), ord('m')).astype(np.uint8)
+        return mask
+
+    # row-wise equality with another batch, an (N, 54) matrix or a single (54,) state
+    # returns a boolean array of length N
+    def equals(self, other):
+        if isinstance(other, CubeBatch):
+            other = other.states
+        return (self.states == other).all(axis=1)
+
+    # row-wise equality of the given pieces only, e.g. pieces_equal(before, ['UF', 'UB'])
+    # returns a boolean array of shape (N, number of pieces)
+    def pieces_equal(self, other, piece_strs: list):
+        if isinstance(other, CubeBatch):
+            other = other.states
+        if other.ndim == 1:
+            other = other[np.newaxis]
+        result = np.empty((len(self.states), len(piece_strs)), dtype=bool)
+        for i, piece_str in enumerate(piece_strs):
+            facelets = list(get_piece_facelets(piece_str).values())
+            result[:, i] = (self.states[:, facelets] == other[:, facelets]).all(axis=1)
+        return result
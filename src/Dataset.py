@@ -0,0 +1,221 @@
+import os
+import json
+import numpy as np
+from src import Cube, CubeBatch, Coordinates, Symmetry
+
+# state encodings and the bytes per state of each
+# 'facelets' is the Cube.facelets array as is and works for masked states,
+# 'packed' stores the center rotation and the CP, CO, EP and EO coordinates of a fully colored cube
+state_widths = {'facelets': 54, 'packed': 9}
+default_colors = Cube.Cube().facelets[Coordinates.center_facelets].tobytes().decode('ascii')
+
+
+# the center colors of the 24 rotations of a cube whose solved centers have colors (in U, R, F, D, L, B order)
+def get_center_rotations(colors: str = default_colors):
+    colors = np.frombuffer(colors.encode('ascii'), dtype=np.uint8)
+    return colors[Symmetry.symmetry_permutations[:24][:, Coordinates.center_facelets] // 9]
+
+
+# returns the rotation index of each row of center colors (N, 6), -1 where the centers are not a rotation
+def find_center_rotations(centers: np.ndarray, colors: str = default_colors):
+    weights = 256 ** np.arange(6, dtype=np.int64)
+    codes = get_center_rotations(colors).astype(np.int64) @ weights
+    order = np.argsort(codes)
+    row_codes = centers.astype(np.int64) @ weights
+    found = np.minimum(np.searchsorted(codes[order], row_codes), len(codes) - 1)
+    return np.where(codes[order][found] == row_codes, order[found], -1)
+
+
+# packs fully colored states (N, 54) into 9 bytes each: a little-endian uint32 of (center rotation, CP, CO)
+# followed by the 5 low bytes of the uint64 (EP, EO)
+# raises ValueError for masked or invalid states
+def pack_states(states: np.ndarray, colors: str = default_colors):
+    states = np.asarray(states, dtype=np.uint8).reshape(-1, 54)
+    rotations = find_center_rotations(states[:, Coordinates.center_facelets], colors)
+    if (rotations < 0).any():
+        raise ValueError("center colors are not a rotation of " + colors)
+    cp, co, ep, eo = Coordinates.facelets_to_cubies(states)
+    high = (rotations * 40320 + Coordinates.rank_permutations(cp)) * 2187 + Coordinates.rank_orientations(co, 3)
+    low = Coordinates.rank_permutations(ep) * 2048 + Coordinates.rank_orientations(eo, 2)
+    packed = np.empty((len(states), 9), dtype=np.uint8)
+    packed[:, :4] = high.astype('<u4').view(np.uint8).reshape(-1, 4)
+    packed[:, 4:] = low.astype('<u8').view(np.uint8).reshape(-1, 8)[:, :5]
+    return packed
+
+
+def unpack_states(packed: np.ndarray, colors: str = default_colors):
+    packed = np.asarray(packed, dtype=np.uint8).reshape(-1, 9)
+    rotations = get_center_rotations(colors)
+    high = np.ascontiguousarray(packed[:, :4]).view('<u4').ravel().astype(np.int64)
+    low_bytes = np.zeros((len(packed), 8), dtype=np.uint8)
+    low_bytes[:, :5] = packed[:, 4:]
+    low = low_bytes.view('<u8').ravel().astype(np.int64)
+    coordinates = {'CO': high % 2187, 'CP': high // 2187 % 40320, 'EO': low % 2048, 'EP': low // 2048}
+    return Coordinates.coordinates_to_facelets(coordinates, rotations[high // 2187 // 40320])
+
+
+def pack_state(state, colors: str = default_colors):
+    return pack_states(state, colors)[0].tobytes()
+
+
+def unpack_state(packed: bytes, colors: str = default_colors):
+    return unpack_states(np.frombuffer(packed, dtype=np.uint8), colors)[0]
+
+
+def encode_states(states: np.ndarray, encoding: str, colors: str = default_colors):
+    if encoding == 'packed':
+        return pack_states(states, colors)
+    return np.asarray(states, dtype=np.uint8).reshape(-1, 54)
+
+
+def decode_states(encoded: np.ndarray, encoding: str, colors: str = default_colors):
+    if encoding == 'packed':
+        return unpack_states(encoded, colors)
+    return encoded
+
+
+# a dataset is a directory of columns, each a flat file indexed by row:
+#   states.bin                      states in the dataset encoding, state_widths[encoding] bytes per row
+#   setups.bin, setups.offsets      setup algorithms as UTF-8, row i is bytes offsets[i]:offsets[i + 1]
+#   <label>.bin                     one file per label, fixed-size values of the label's NumPy dtype
+#   <label>.bin, <label>.offsets    or UTF-8 strings for labels with dtype 'str'
+# meta.json has the encoding, colors, number of rows and label dtypes, and is written last
+class DatasetWriter:
+    def __init__(self, directory: str, labels: dict = None, encoding: str = 'facelets', colors: str = default_colors):
+        if encoding not in state_widths:
+            raise ValueError("unknown encoding " + encoding + ", use one of " + str(list(state_widths)))
+        self.directory = directory
+        self.labels = dict(labels or {})
+        self.encoding = encoding
+        self.colors = colors
+        self.rows = 0
+        os.makedirs(directory, exist_ok=True)
+        self.files = dict()
+        self.offsets = dict()
+        for column in ['states', 'setups'] + list(self.labels):
+            self.files[column] = open(os.path.join(directory, column + '.bin'), 'wb')
+        for column in ['setups'] + [label for label, dtype in self.labels.items() if dtype == 'str']:
+            self.files[column + '.offsets'] = open(os.path.join(directory, column + '.offsets'), 'wb')
+            self.offsets[column] = 0
+            np.zeros(1, dtype=np.int64).tofile(self.files[column + '.offsets'])
+
+    def write_strings(self, column: str, values):
+        data = [str(value).encode('utf-8') for value in values]
+        ends = self.offsets[column] + np.cumsum([len(value) for value in data], dtype=np.int64)
+        self.files[column].write(b''.join(data))
+        ends.tofile(self.files[column + '.offsets'])
+        if len(ends):
+            self.offsets[column] = int(ends[-1])
+
+    # appends a batch of rows: states (N, 54), N setup strings and N values for every label
+    # all arguments are checked and converted before anything is written, so a bad call leaves the columns as they were
+    def append(self, states: np.ndarray, setups, **labels):
+        states = np.asarray(states, dtype=np.uint8).reshape(-1, 54)
+        setups = list(setups)
+        if len(setups) != len(states) or set(labels) != set(self.labels):
+            raise ValueError("every row needs a state, a setup and a value for each of the labels " + str(list(self.labels)))
+        encoded = encode_states(states, self.encoding, self.colors)
+        values = dict()
+        for label, dtype in self.labels.items():
+            values[label] = list(labels[label]) if dtype == 'str' else np.asarray(labels[label], dtype=dtype).reshape(-1)
+            if len(values[label]) != len(states):
+                raise ValueError("label " + label + " needs one value per row")
+        encoded.tofile(self.files['states'])
+        self.write_strings('setups', setups)
+        for label, dtype in self.labels.items():
+            if dtype == 'str':
+                self.write_strings(label, values[label])
+            else:
+                values[label].tofile(self.files[label])
+        self.rows += len(states)
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+        with open(os.path.join(self.directory, 'meta.json'), 'w') as file:
+            json.dump({'rows': self.rows, 'encoding': self.encoding, 'colors': self.colors,
+                       'labels': {label: np.dtype(dtype).str if dtype != 'str' else 'str'
+                                  for label, dtype in self.labels.items()}}, file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# variable-length strings read through memory maps
+class StringColumn:
+    def __init__(self, path: str):
+        self.offsets = np.memmap(path + '.offsets', dtype=np.int64, mode='r')
+        self.data = np.memmap(path + '.bin', dtype=np.uint8, mode='r') if os.path.getsize(path + '.bin') else b''
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        return bytes(self.data[self.offsets[row]:self.offsets[row + 1]]).decode('utf-8')
+
+
+# a dataset written by DatasetWriter, every column is memory-mapped so datasets larger than memory can be read,
+# and worker processes opening the same dataset share its pages
+# with the 'facelets' encoding, facelets() and batch() slice the states without copying; the mapping is
+# read-only, and a CubeBatch over it gets its own array with its first move
+class Dataset:
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as file:
+            meta = json.load(file)
+        self.rows = meta['rows']
+        self.encoding = meta['encoding']
+        self.colors = meta['colors']
+        self.label_dtypes = meta['labels']
+        self.states = self.map_column('states', np.uint8, state_widths[self.encoding])
+        self.setups = StringColumn(os.path.join(directory, 'setups'))
+        self.labels = dict()
+        for label, dtype in self.label_dtypes.items():
+            if dtype == 'str':
+                self.labels[label] = StringColumn(os.path.join(directory, label))
+            else:
+                self.labels[label] = self.map_column(label, np.dtype(dtype), 1)
+
+    def map_column(self, name: str, dtype, width: int):
+        path = os.path.join(self.directory, name + '.bin')
+        if not self.rows:
+            return np.zeros((0, width) if width > 1 else 0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(self.rows, width) if width > 1 else (self.rows,))
+
+    def __len__(self):
+        return self.rows
+
+    # returns the facelets of rows (an int, a slice or an index array) as (k, 54)
+    def facelets(self, rows=slice(None)):
+        return decode_states(np.atleast_2d(self.states[rows]), self.encoding, self.colors)
+
+    def batch(self, rows=slice(None)):
+        return CubeBatch.CubeBatch(self.facelets(rows))
+
+    def cube(self, row: int):
+        cube = Cube.Cube()
+        cube.set_state(self.facelets(row)[0])
+        return cube
+
+    # returns row i as a dict of its setup and labels
+    def record(self, row: int):
+        record = {'setup': self.setups[row]}
+        for label, column in self.labels.items():
+            value = column[row]
+            record[label] = value if type(value) == str else value.item()
+        return record
+
+
+# writes all rows of a Cases.CaseTable to a dataset, with the generating algorithms as setups and the distances as labels
+def from_case_table(table, directory: str, encoding: str = 'facelets', chunk_rows: int = 1 << 16):
+    with DatasetWriter(directory, {'distance': np.uint8}, encoding) as writer:
+        for first in range(0, len(table), chunk_rows):
+            rows = range(first, min(len(table), first + chunk_rows))
+            writer.append(table.states[first:rows.stop], [table.algorithm(row) for row in rows],
+                          distance=table.distances[first:rows.stop])
+    return Dataset(directory)
@@ -0,0 +1,278 @@
+import asyncio
+import ssl
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+import requests
+from src import Render
+
+visualcube_base_url = "https://www.rouxer.com/visualcube.php"
+
+# statuses worth retrying, everything else is returned as is
+retry_statuses = {408, 429, 500, 502, 503, 504}
+
+
+# builds a Visual Cube URL in the same format as Cube.viscube_image
+def visualcube_url(fc: str, size: int = 200, view=None, fmt: str = 'svg', base_url: str = visualcube_base_url):
+    url = base_url + "?size=%d&bg=white&fmt=%s" % (size, fmt)
+    if view is not None:
+        url += "&view=" + view
+    return url + '&fc=' + fc
+
+
+# items can be URLs or facelet strings, which are turned into Visual Cube URLs
+def item_to_url(item: str, size: int, view, fmt: str, base_url: str):
+    if item.startswith('http://') or item.startswith('https://'):
+        return item
+    return visualcube_url(item, size, view, fmt, base_url)
+
+
+class HTTPError(Exception):
+    pass
+
+
+# keep-alive HTTP/1.1 connections, pooled per (scheme, host, port)
+class ConnectionPool:
+    def __init__(self, max_idle: int = 16):
+        self.max_idle = max_idle
+        self.idle = dict()
+        self.opened = 0     # number of connections opened, reuse shows as opened < requests
+
+    async def acquire(self, scheme: str, host: str, port: int):
+        connections = self.idle.get((scheme, host, port))
+        while connections:
+            reader, writer = connections.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+        self.opened += 1
+        return await asyncio.open_connection(host, port, ssl=ssl.create_default_context() if scheme == 'https' else None)
+
+    def release(self, scheme: str, host: str, port: int, connection, reusable: bool):
+        connections = self.idle.setdefault((scheme, host, port), [])
+        if reusable and len(connections) < self.max_idle:
+            connections.append(connection)
+        else:
+            connection[1].close()
+
+    def close(self):
+        for connections in self.idle.values():
+            for _, writer in connections:
+                writer.close()
+        self.idle.clear()
+
+
+# spaces out request starts so that at most rate requests start per second
+class RateLimiter:
+    def __init__(self, rate: float = None):
+        self.interval = 1 / rate if rate else 0
+        self.next_start = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.next_start - now
+            self.next_start = max(now, self.next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed before the response")
+    version, status = status_line.decode('latin-1').split(' ', 2)[:2]
+    headers = dict()
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    reusable = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            chunk_size = int((await reader.readline()).split(b';')[0], 16)
+            if chunk_size == 0:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                break
+            chunks.append(await reader.readexactly(chunk_size))
+            await reader.readline()
+        body = b''.join(chunks)
+    elif 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    else:
+        body = await reader.read()
+        reusable = False
+    return int(status), headers, body, reusable
+
+
+# fetches many URLs concurrently over pooled keep-alive connections
+# concurrency bounds the requests in flight, rate bounds the requests started per second
+# failed requests (connection errors, timeouts, statuses in retry_statuses) are retried with exponential backoff
+class BulkFetcher:
+    def __init__(self, concurrency: int = 8, rate: float = None, retries: int = 3, backoff: float = 0.5,
+                 timeout: float = 30):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.requests = 0
+        self.pool = None
+
+    async def request(self, url: str):
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        connection = await self.pool.acquire(parts.scheme, parts.hostname, port)
+        reader, writer = connection
+        reusable = False
+        try:
+            writer.write(('GET %s HTTP/1.1\r\nHost: %s\r\nConnection: keep-alive\r\nAccept: */*\r\n\r\n'
+                          % (target, parts.netloc)).encode('latin-1'))
+            await writer.drain()
+            status, headers, body, reusable = await read_response(reader)
+        finally:
+            self.pool.release(parts.scheme, parts.hostname, port, connection, reusable)
+        self.requests += 1
+        return status, headers, body
+
+    # returns a result dict with keys 'url', 'status', 'content', 'attempts' and 'error'
+    async def fetch(self, url: str, limiter: RateLimiter):
+        result = {'url': url, 'status': None, 'content': None, 'attempts': 0, 'error': None}
+        for attempt in range(self.retries + 1):
+            await limiter.wait()
+            result['attempts'] = attempt + 1
+            delay = self.backoff * 2 ** attempt
+            try:
+                status, headers, body = await asyncio.wait_for(self.request(url), self.timeout)
+                result['status'], result['content'], result['error'] = status, body, None
+                if status not in retry_statuses:
+                    return result
+                result['error'] = HTTPError("HTTP status %d" % status)
+                if headers.get('retry-after', '').isdigit():
+                    delay = max(delay, int(headers['retry-after']))
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as error:
+                result['error'] = error
+            if attempt < self.retries:
+                await asyncio.sleep(delay)
+        return result
+
+    # yields (index, result) pairs as the requests complete, memory stays bounded by the concurrency
+    async def stream(self, urls):
+        self.pool = ConnectionPool(max_idle=self.concurrency)
+        limiter = RateLimiter(self.rate)
+        jobs = asyncio.Queue(maxsize=2 * self.concurrency)
+        results = asyncio.Queue()
+        done = object()
+
+        async def producer():
+            for job in enumerate(urls):
+                await jobs.put(job)
+            for _ in range(self.concurrency):
+                await jobs.put(done)
+
+        async def worker():
+            while True:
+                job = await jobs.get()
+                if job is done:
+                    await results.put(done)
+                    return
+                index, url = job
+                await results.put((index, await self.fetch(url, limiter)))
+
+        tasks = [asyncio.create_task(producer())] + [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            remaining = self.concurrency
+            while remaining:
+                result = await results.get()
+                if result is done:
+                    remaining -= 1
+                else:
+                    yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.pool.close()
+
+
+# asynchronously fetches images for a list of facelet strings or URLs, yielding (index, result) as they complete
+async def fetch_stream(items, size: int = 200, view=None, fmt: str = 'svg', base_url: str = visualcube_base_url,
+                       **fetcher_options):
+    fetcher = BulkFetcher(**fetcher_options)
+    urls = (item_to_url(item, size, view, fmt, base_url) for item in items)
+    async for index, result in fetcher.stream(urls):
+        yield index, result
+
+
+# blocking wrapper around fetch_stream, returns the results in the order of items
+def fetch_all(items, size: int = 200, view=None, fmt: str = 'svg', base_url: str = visualcube_base_url,
+              **fetcher_options):
+    items = list(items)
+
+    async def collect():
+        results = [None] * len(items)
+        async for index, result in fetch_stream(items, size, view, fmt, base_url, **fetcher_options):
+            results[index] = result
+        return results
+
+    return asyncio.run(collect())
+
+
+session = None
+
+
+# renderer for RenderCache that fetches from the remote Visual Cube service over a keep-alive session
+def remote_renderer(fc: str, size: int, view, fmt: str):
+    global session
+    if session is None:
+        session = requests.Session()
+    response = session.get(visualcube_url(fc, size, view, fmt))
+    response.raise_for_status()
+    return response.content
+
+
+class LocalVisualCubeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True      # headers and body are separate writes on a kept-alive connection
+
+    # a query that can not be rendered (bad size, view or fc) is answered with 400
+    def do_GET(self):
+        try:
+            params = Render.url_to_params(self.path)
+            body = Render.render(params['fc'], params['size'], params['view'], params['fmt'], params['bg'])
+        except ValueError as error:
+            self.send_error(400, str(error))
+            return
+        if params['fmt'] == 'svg':
+            body = body.encode('utf-8')
+            content_type = 'image/svg+xml'
+        else:
+            content_type = 'image/png'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# starts a stand-in Visual Cube server that renders locally, in a background thread
+# returns the server and its base URL, to be used as base_url; stop it with server.shutdown()
+# handler can be a subclass of LocalVisualCubeHandler, e.g. one adding delays or failures in tests
+def serve_local(host: str = '127.0.0.1', port: int = 0, handler=LocalVisualCubeHandler):
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://%s:%d/visualcube.php' % server.server_address
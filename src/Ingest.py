@@ -0,0 +1,200 @@
+import os
+import csv
+import gzip
+import json
+import time
+import random
+import tempfile
+import tracemalloc
+from src import Cube
+
+# column and key names accepted for each field of a record
+field_aliases = {
+    'name': ['name', 'case', 'id'],
+    'setup': ['setup', 'scramble'],
+    'algorithm': ['algorithm', 'alg', 'solution'],
+}
+error_modes = ['raise', 'skip', 'yield']
+
+
+# error in an algorithm file, with the line and the field it was found in
+# column is the position of the invalid character in the field, and in the line for text files
+class IngestError(ValueError):
+    def __init__(self, path: str, line: int, field: str, column: int, message: str):
+        self.path = path
+        self.line = line
+        self.field = field
+        self.column = column
+        super().__init__("%s:%d:%d: %s (in %s)" % (path, line, column, message, field))
+
+
+# a record a reader could not read at all, such as a line that is not JSON
+# readers yield it in place of the fields, read_algorithms turns it into an IngestError
+class RecordError(Exception):
+    def __init__(self, column: int, message: str):
+        self.column = column
+        self.message = message
+        super().__init__(message)
+
+
+def get_format(path: str):
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith('.jsonl') or name.endswith('.ndjson'):
+        return 'jsonl'
+    return 'text'
+
+
+def open_text(path: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+# text files have one record per line: "algorithm", "name<TAB>algorithm" or "name<TAB>setup<TAB>algorithm"
+# blank lines and lines starting with # are skipped, lines with more than three fields are errors
+# yields (line number, {field: (value, offset of the value in the line)})
+def read_text(file):
+    for line_number, line in enumerate(file, 1):
+        line = line.rstrip('\r\n')
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        values = line.split('\t')
+        if len(values) > 3:
+            column = sum(len(value) + 1 for value in values[:3])
+            yield line_number, RecordError(column, "expected at most 3 tab-separated fields, got %d" % len(values))
+            continue
+        names = {1: ['algorithm'], 2: ['name', 'algorithm']}.get(len(values), ['name', 'setup', 'algorithm'])
+        fields = dict()
+        offset = 0
+        for name, value in zip(names, values):
+            fields[name] = (value, offset)
+            offset += len(value) + 1
+        yield line_number, fields
+
+
+def pick_fields(record: dict):
+    fields = dict()
+    for field, aliases in field_aliases.items():
+        for alias in aliases:
+            if record.get(alias) is not None:
+                fields[field] = (str(record[alias]), None)
+                break
+    return fields
+
+
+# CSV files need a header row naming the columns, see field_aliases; rows with more fields than it are errors
+def read_csv(file):
+    reader = csv.DictReader(file)
+    for record in reader:
+        if record.get(None):
+            yield reader.line_num, RecordError(0, "expected at most %d fields, got %d"
+                                               % (len(reader.fieldnames), len(reader.fieldnames) + len(record[None])))
+            continue
+        yield reader.line_num, pick_fields(record)
+
+
+def read_jsonl(file):
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as error:
+            # columns are 0-based like those of tokenizer errors, pos is colno - 1 on a single line
+            yield line_number, RecordError(error.pos, "invalid JSON: " + error.msg)
+            continue
+        if type(record) != dict:
+            yield line_number, RecordError(0, "expected a JSON object, got " + type(record).__name__)
+            continue
+        yield line_number, pick_fields(record)
+
+
+readers = {'text': read_text, 'csv': read_csv, 'jsonl': read_jsonl}
+
+
+# streams the records of an algorithm file (text, CSV or JSON lines, optionally gzipped) one at a time
+# yields dicts with 'line', 'name', 'setup', 'algorithm' and the parsed 'setup_moves' and 'moves' as lists of
+# [move, magnitude]; only one line is held at a time, so memory does not grow with the file
+# errors: 'raise' raises IngestError, 'skip' drops bad records and 'yield' yields them with an 'error' key
+def read_algorithms(source, fmt: str = None, errors: str = 'raise'):
+    if errors not in error_modes:
+        raise ValueError("errors must be one of " + str(error_modes))
+    path = source if type(source) == str else getattr(source, 'name', '<stream>')
+    if fmt is None:
+        fmt = get_format(path)
+    file = open_text(source) if type(source) == str else source
+    try:
+        for line_number, fields in readers[fmt](file):
+            record = {'line': line_number, 'name': None, 'setup': '', 'algorithm': '', 'error': None}
+            record_error = fields if isinstance(fields, RecordError) else None
+            if record_error is not None:
+                fields = dict()
+            for field, (value, _) in fields.items():
+                record[field] = value
+            try:
+                if record_error is not None:
+                    raise IngestError(path, line_number, 'record', record_error.column, record_error.message)
+                for field, key in [('setup', 'setup_moves'), ('algorithm', 'moves')]:
+                    value, offset = fields.get(field, ('', None))
+                    try:
+                        record[key] = Cube.tokenize_moves(value)
+                    except Cube.MoveSyntaxError as error:
+                        column = error.column if offset is None else offset + error.column
+                        raise IngestError(path, line_number, field, column,
+                                          "invalid character %r" % value[error.column])
+            except IngestError as error:
+                if errors == 'raise':
+                    raise
+                if errors == 'skip':
+                    continue
+                record['error'] = error
+            yield record
+    finally:
+        if file is not source:
+            file.close()
+
+
+# writes n random records to path in the format of its extension, for benchmarks
+def write_random_algorithms(path: str, n: int, seed: int = 0):
+    rng = random.Random(seed)
+    moves = [face + suffix for face in Cube.face_keys + ['M', 'r'] for suffix in ['', "'", '2']]
+    fmt = get_format(path)
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file) if fmt == 'csv' else None
+        if writer:
+            writer.writerow(['name', 'setup', 'algorithm'])
+        for i in range(n):
+            setup = ' '.join(rng.choice(moves) for _ in range(rng.randint(8, 20)))
+            algorithm = ' '.join(rng.choice(moves) for _ in range(rng.randint(8, 20)))
+            if fmt == 'csv':
+                writer.writerow(['case %d' % i, setup, algorithm])
+            elif fmt == 'jsonl':
+                file.write(json.dumps({'name': 'case %d' % i, 'setup': setup, 'algorithm': algorithm}) + '\n')
+            else:
+                file.write('case %d\t%s\t%s\n' % (i, setup, algorithm))
+
+
+# measures ingestion of n random records in each format: records per second, MB per second and peak Python memory
+def benchmark_ingestion(n: int = 100000, formats=('text', 'csv', 'jsonl')):
+    results = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        for fmt in formats:
+            path = os.path.join(directory, 'algorithms.' + {'text': 'txt', 'csv': 'csv', 'jsonl': 'jsonl'}[fmt])
+            write_random_algorithms(path, n)
+            start = time.perf_counter()
+            count = sum(1 for _ in read_algorithms(path))
+            elapsed = time.perf_counter() - start
+            # a second pass for memory, tracing allocations slows the reading down
+            tracemalloc.start()
+            sum(1 for _ in read_algorithms(path))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[fmt] = {
+                'records': count,
+                'records_per_second': count / elapsed,
+                'MB_per_second': os.path.getsize(path) / elapsed / 1e6,
+                'peak_memory_bytes': peak,
+            }
+    return results
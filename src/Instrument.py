@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import functools
+from src import Cube, Mask
+
+# opt-in counters and timings of Cube operations
+# enable() replaces the instrumented functions with timing wrappers and disable() puts the originals back,
+# so there is no cost at all while instrumentation is off
+
+max_events = 1000000        # trace events kept per process, later ones are only counted
+
+enabled = False
+tracing = False
+counters = dict()           # {name: [calls, total nanoseconds]}
+events = []                 # (name, start ns, duration ns, pid) of each call while tracing
+originals = dict()          # {(owner, attribute): the attribute as it was before enable()}
+last_permutation_ns = 0     # duration of the last apply_permutation, shared out over the moves of do_moves
+
+# the functions that are timed: (class or module, attribute, name in the report)
+# masking is reported under the names starting with 'mask.'
+instrumented_functions = [
+    (Cube.Cube, 'get_state', 'get_state'),
+    (Cube.Cube, 'set_state', 'set_state'),
+    (Cube.Cube, 'set_piece_color', 'set_piece_color'),
+    (Cube.Cube, 'EO_mask', 'EO_mask'),
+    (Cube.Cube, 'viscube_image', 'viscube_image'),
+    (Cube.Cube, 'CMLL_affects_EO', 'CMLL_affects_EO'),
+    (Cube, 'compile_moves', 'compile_moves'),
+    (Mask.StickerMask, 'apply', 'mask.apply'),
+    (Mask.StickerMask, 'from_pieces', 'mask.from_pieces'),
+    (Mask, 'EO_change_masks', 'mask.EO_change_masks'),
+]
+
+
+def move_type(move: str):
+    if move.upper() in Cube.axis_keys:
+        return 'rotation'
+    if move.upper() in Cube.slice_keys:
+        return 'slice'
+    return 'wide' if move.islower() else 'face'
+
+
+move_names = {move: 'move[%s]' % move_type(move) for move in Cube.valid_moves}
+
+
+def record(name: str, start: int, end: int):
+    entry = counters.get(name)
+    if entry is None:
+        entry = counters[name] = [0, 0]
+    entry[0] += 1
+    entry[1] += end - start
+    if tracing and len(events) < max_events:
+        events.append((name, start, end - start, os.getpid()))
+
+
+# adds calls to a counter without a trace event, for moves that were done together in one gather
+def record_calls(name: str, calls: int, nanoseconds: int):
+    entry = counters.get(name)
+    if entry is None:
+        entry = counters[name] = [0, 0]
+    entry[0] += calls
+    entry[1] += nanoseconds
+
+
+def timed(name: str, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record(name, start, time.perf_counter_ns())
+    return wrapper
+
+
+# apply_permutation is the gather behind move and do_moves, its duration is kept for timed_do_moves
+def timed_apply_permutation(function):
+    @functools.wraps(function)
+    def wrapper(self, permutation):
+        global last_permutation_ns
+        start = time.perf_counter_ns()
+        try:
+            return function(self, permutation)
+        finally:
+            end = time.perf_counter_ns()
+            last_permutation_ns = end - start
+            record('apply_permutation', start, end)
+    return wrapper
+
+
+# do_moves compiles its moves into one permutation, so the moves it did are counted by type afterwards,
+# each with an equal share of the time of that permutation
+def timed_do_moves(function):
+    @functools.wraps(function)
+    def wrapper(self, move_str, simplify=False, strict=False):
+        global last_permutation_ns
+        last_permutation_ns = 0
+        start = time.perf_counter_ns()
+        try:
+            function(self, move_str, simplify, strict)
+        finally:
+            record('do_moves', start, time.perf_counter_ns())
+        compile_moves = originals[(Cube, 'compile_moves')]
+        if simplify and compile_moves(move_str)[0]:
+            from src import Simplify
+            move_str = Simplify.simplify_moves(move_str)
+        moves = [move for move, magnitude in compile_moves(move_str)[1] if magnitude % 4]
+        for move in moves:
+            record_calls(move_names.get(move, 'move'), 1, last_permutation_ns // len(moves))
+    return wrapper
+
+
+def timed_move(function):
+    @functools.wraps(function)
+    def wrapper(self, move, magnitude):
+        start = time.perf_counter_ns()
+        try:
+            return function(self, move, magnitude)
+        finally:
+            record(move_names.get(move, 'move'), start, time.perf_counter_ns())
+    return wrapper
+
+
+# starts counting; with trace=True every call is also kept as an event for write_chrome_trace
+def enable(trace=False):
+    global enabled, tracing
+    tracing = trace
+    if enabled:
+        return
+    enabled = True
+    wrappers = [(Cube.Cube, 'move', timed_move), (Cube.Cube, 'apply_permutation', timed_apply_permutation),
+                (Cube.Cube, 'do_moves', timed_do_moves)]
+    wrappers += [(owner, attribute, functools.partial(timed, name))
+                 for owner, attribute, name in instrumented_functions]
+    for owner, attribute, wrap in wrappers:
+        original = vars(owner)[attribute]
+        originals[(owner, attribute)] = original
+        if isinstance(original, classmethod):
+            setattr(owner, attribute, classmethod(wrap(original.__func__)))
+        else:
+            setattr(owner, attribute, wrap(original))
+
+
+def disable():
+    global enabled, tracing
+    if not enabled:
+        return
+    for (owner, attribute), original in originals.items():
+        setattr(owner, attribute, original)
+    originals.clear()
+    enabled = False
+    tracing = False
+
+
+def reset():
+    counters.clear()
+    events.clear()
+
+
+# with instrumented(): ... counts the calls inside the block
+class instrumented:
+    def __init__(self, trace=False):
+        self.trace = trace
+
+    def __enter__(self):
+        enable(self.trace)
+        return self
+
+    def __exit__(self, *exc_info):
+        disable()
+
+
+# returns the counters and events of this process, e.g. to send them from a worker, and optionally clears them
+def collect(clear=True):
+    data = {'counters': {name: list(entry) for name, entry in counters.items()}, 'events': list(events)}
+    if clear:
+        reset()
+    return data
+
+
+# adds counters and events collected in another process to the ones of this process
+def merge(data: dict):
+    for name, (calls, nanoseconds) in data['counters'].items():
+        entry = counters.get(name)
+        if entry is None:
+            entry = counters[name] = [0, 0]
+        entry[0] += calls
+        entry[1] += nanoseconds
+    room = max_events - len(events)
+    events.extend(tuple(event) for event in data['events'][:room])
+
+
+# {name: {'calls', 'seconds', 'mean_us'}}, times include the time of nested instrumented calls
+def stats():
+    return {name: {'calls': calls, 'seconds': nanoseconds / 1e9, 'mean_us': nanoseconds / calls / 1e3}
+            for name, (calls, nanoseconds) in counters.items()}
+
+
+# returns the totals as a table, one line per operation, most time first
+def report():
+    lines = ['%-20s %10s %12s %12s' % ('operation', 'calls', 'total ms', 'mean us')]
+    for name, entry in sorted(stats().items(), key=lambda item: -item[1]['seconds']):
+        lines.append('%-20s %10d %12.3f %12.3f' % (name, entry['calls'], entry['seconds'] * 1e3, entry['mean_us']))
+    return '\n'.join(lines)
+
+
+# writes the traced calls in the Chrome trace event format (chrome://tracing, Perfetto), one track per process
+def write_chrome_trace(path: str):
+    trace_events = [{'name': name, 'cat': 'cube', 'ph': 'X', 'ts': start / 1e3, 'dur': duration / 1e3,
+                     'pid': pid, 'tid': pid} for name, start, duration, pid in events]
+    with open(path, 'w') as file:
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms',
+                   'otherData': {'counters': stats()}}, file)
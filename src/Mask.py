@@ -0,0 +1,116 @@
+import functools
+import numpy as np
+from src import Cube
+
+LSE_edges = ['UF', 'UR', 'UB', 'UL', 'DF', 'DB']
+
+
+# returns the facelet indices of a piece given by its letters (e.g. "UF"), in the order of its letters
+def piece_stickers(piece_str):
+    face_to_facelet = Cube.coords_to_facelets[tuple(Cube.string_to_index[frozenset(piece_str)])]
+    return [face_to_facelet[face] for face in piece_str]
+
+
+# the stickers of pieces as a (k, 3) index array, edges and centers padded by repeating their first sticker
+@functools.lru_cache(maxsize=None)
+def pieces_stickers(pieces: tuple):
+    stickers = np.array([(piece_stickers(piece_str) * 3)[:3] for piece_str in pieces], dtype=np.intp)
+    stickers.setflags(write=False)
+    return stickers
+
+
+def color_code(color):
+    return ord(color) if type(color) == str else color
+
+
+# a boolean lookup over color codes, True for the given colors
+@functools.lru_cache(maxsize=None)
+def color_table(colors: str):
+    table = np.zeros(256, dtype=bool)
+    table[[color_code(color) for color in colors]] = True
+    table.setflags(write=False)
+    return table
+
+
+# a recoloring applied to states only when they are displayed, the states themselves are never changed
+#   colors: uint8 array of shape (54,) or (N, 54), a color code per sticker that replaces the sticker's color, 0 keeps it
+#   lookup: optional uint8 array of shape (256,), maps the color code of every sticker that is kept
+# a mask of shape (N, 54) recolors a batch of N states, one row each
+class StickerMask:
+    def __init__(self, colors: np.ndarray = None, lookup: np.ndarray = None):
+        self.colors = np.zeros(54, dtype=np.uint8) if colors is None else np.asarray(colors, dtype=np.uint8)
+        self.lookup = lookup
+
+    # a mask giving color to every sticker where selection (a boolean array of shape (54,) or (N, 54)) is True
+    @classmethod
+    def from_selection(cls, selection: np.ndarray, color):
+        return cls(np.where(selection, color_code(color), 0).astype(np.uint8))
+
+    # a mask giving each piece of pieces (by position, e.g. ['UF', 'DB']) one color
+    # colors has one color per piece, as a string, a list or a (k,) array of codes, or an (N, k) array for a batch;
+    # ' ' or 0 keeps the colors of a piece
+    @classmethod
+    def from_pieces(cls, pieces: list, colors):
+        if type(colors) == str:
+            colors = [color_code(color) for color in colors.replace(' ', '\0')]
+        elif type(colors) == list:
+            colors = [color_code(color) for color in colors]
+        colors = np.asarray(colors, dtype=np.uint8)
+        mask = np.zeros(colors.shape[:-1] + (54,), dtype=np.uint8)
+        mask[..., pieces_stickers(tuple(pieces))] = colors[..., np.newaxis]
+        return cls(mask)
+
+    # a mask replacing colors wherever they appear, e.g. recolor({'r': 't', 'o': 't'}) hides the red and orange stickers
+    @classmethod
+    def recolor(cls, mapping: dict):
+        lookup = np.arange(256, dtype=np.uint8)
+        for color, new_color in mapping.items():
+            lookup[color_code(color)] = color_code(new_color)
+        return cls(lookup=lookup)
+
+    def __len__(self):
+        return len(self.colors) if self.colors.ndim == 2 else 1
+
+    def __getitem__(self, rows):
+        return StickerMask(self.colors[rows], self.lookup)
+
+    # the mask that applies this mask and then other
+    def then(self, other):
+        colors = self.colors if other.lookup is None else np.where(self.colors != 0, other.lookup[self.colors], 0)
+        colors = np.where(other.colors != 0, other.colors, colors).astype(np.uint8)
+        if self.lookup is None or other.lookup is None:
+            lookup = self.lookup if other.lookup is None else other.lookup
+        else:
+            lookup = other.lookup[self.lookup]
+        return StickerMask(colors, lookup)
+
+    # returns the masked colors of states (54,) or (N, 54) as a new array
+    def apply(self, states: np.ndarray):
+        if self.lookup is not None:
+            states = self.lookup[states]
+        return np.where(self.colors != 0, self.colors, states).astype(np.uint8)
+
+
+# vectorized predicates over states of shape (54,) or (N, 54), they return arrays of shape (k,) or (N, k) for k pieces
+
+# True for edges whose reference sticker (the one on the first face of the edge's name) has one of the U/D colors
+def oriented_edges(states: np.ndarray, edges: list = LSE_edges, colors: str = 'wy'):
+    return color_table(colors)[np.asarray(states)[..., pieces_stickers(tuple(edges))[:, 0]]]
+
+
+# True for pieces with the same colors in both states, states can also be a single state compared to a batch
+def unchanged_pieces(before: np.ndarray, after: np.ndarray, pieces: list):
+    stickers = pieces_stickers(tuple(pieces))
+    return (np.asarray(before)[..., stickers] == np.asarray(after)[..., stickers]).all(axis=-1)
+
+
+# the EO masks used to show how an algorithm changes the edges: 'y' for oriented and 'm' for misoriented edges,
+# 't' for edges that are left unchanged; returns the masks of the states before and after the algorithm
+def EO_change_masks(before: np.ndarray, after: np.ndarray, edges: list = LSE_edges):
+    unchanged = unchanged_pieces(before, after, edges)
+    masks = []
+    for states in [before, after]:
+        labels = np.where(oriented_edges(states, edges), ord('y'), ord('m'))
+        labels = np.where(unchanged, ord('t'), labels)
+        masks.append(StickerMask.from_pieces(edges, labels))
+    return masks[0], masks[1]
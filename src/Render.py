@@ -0,0 +1,203 @@
+import numpy as np
+import functools
+from PIL import Image, ImageDraw
+from io import BytesIO
+from urllib.parse import urlparse, parse_qs
+from src import Cube
+
+# colors of the Visual Cube 'fc' letters, 't' (transparent) stickers are not drawn
+sticker_colors = {
+    'w': '#ffffff',
+    'y': '#fefe00',
+    'r': '#ee0000',
+    'o': '#ffa100',
+    'b': '#0000f2',
+    'g': '#00d800',
+    'm': '#a83dd9',
+    'p': '#f0a0c0',
+    'n': '#404040',
+    'd': '#404040',
+    'l': '#bbbbbb',
+    's': '#8c8c8c',
+    'k': '#000000',
+    'x': '#bbbbbb',
+}
+cube_color = '#000000'
+
+# opacities of the cube body and of the stickers, as used by Visual Cube for each view
+view_opacity = {
+    None: (1.0, 1.0),
+    'trans': (0.5, 0.5),
+}
+
+# default Visual Cube camera: r=y45x-34 and dist=5 for a unit cube
+view_rotation_y = np.radians(-45)
+view_rotation_x = np.radians(34)
+view_distance = 5 * 3
+sticker_size = 0.9      # fraction of a piece covered by its sticker
+
+face_normals = Cube.face_normals
+
+
+# returns the 4 corners of a square of the given size around center, lying in the plane normal to normal
+def square_corners(center, normal, size):
+    u, v = [np.eye(3)[axis] for axis in range(3) if normal[axis] == 0]
+    half = size / 2
+    return np.array([center + half * (su * u + sv * v) for su, sv in [(1, 1), (1, -1), (-1, -1), (-1, 1)]])
+
+
+# rotates points into the camera frame and projects them onto the image plane
+# returns the projected (x, y) points with y pointing down and the depth of each point
+def project(points):
+    cos_y, sin_y = np.cos(view_rotation_y), np.sin(view_rotation_y)
+    cos_x, sin_x = np.cos(view_rotation_x), np.sin(view_rotation_x)
+    x = points[..., 0] * cos_y + points[..., 2] * sin_y
+    z = -points[..., 0] * sin_y + points[..., 2] * cos_y
+    y = points[..., 1] * cos_x - z * sin_x
+    z = points[..., 1] * sin_x + z * cos_x
+    perspective = view_distance / (view_distance - z)
+    return np.stack([x * perspective, -y * perspective], axis=-1), z
+
+
+# precomputes the projected polygons of every sticker and face of the cube
+# returns a dict with the sticker polygons (54, 4, 2), the face polygons (6, 4, 2),
+# the faces ordered from back to front, the faces facing the camera and the bounding box of the drawing
+def init_geometry():
+    sticker_points = np.empty((54, 4, 3))
+    for i, (y, x, z, face) in enumerate(Cube.facelet_coords):
+        normal = np.array(face_normals[face])
+        center = np.array([x - 1, 1 - y, 1 - z]) + normal / 2
+        sticker_points[i] = square_corners(center, normal, sticker_size)
+    face_points = np.array([square_corners(1.5 * np.array(face_normals[face]), face_normals[face], 3)
+                            for face in Cube.face_keys])
+    stickers, _ = project(sticker_points)
+    faces, _ = project(face_points)
+    _, face_depths = project(1.5 * np.array([face_normals[face] for face in Cube.face_keys], dtype=float))
+    low, high = faces.min(axis=(0, 1)), faces.max(axis=(0, 1))
+    margin = 0.05 * (high - low).max()
+    return {
+        'stickers': stickers,
+        'faces': faces,
+        'face_order': list(np.argsort(face_depths)),
+        'visible': set(np.nonzero(face_depths > 0)[0]),
+        'origin': low - margin,
+        'extent': (high - low).max() + 2 * margin,
+    }
+
+
+geometry = init_geometry()
+
+
+def svg_points(polygon):
+    return ' '.join('%.3f,%.3f' % (x, y) for x, y in polygon)
+
+
+sticker_svg_points = [svg_points(polygon) for polygon in geometry['stickers']]
+face_svg_points = [svg_points(polygon) for polygon in geometry['faces']]
+
+
+# raises ValueError for a view that is not rendered locally
+def check_view(view):
+    if view not in view_opacity:
+        raise ValueError("unsupported view %r, the supported views are %s"
+                         % (view, ', '.join(repr(supported) for supported in view_opacity)))
+
+
+# returns the face indices to draw, back to front, for a view
+def faces_to_draw(view):
+    if view == 'trans':
+        return geometry['face_order']
+    return [face for face in geometry['face_order'] if face in geometry['visible']]
+
+
+# renders a Visual Cube 'fc' string as an SVG document
+# view can be None or 'trans', bg is an SVG color or 't' for no background
+def render_svg(fc: str, size: int = 200, view=None, bg='white'):
+    check_view(view)
+    cube_opacity, sticker_opacity = view_opacity[view]
+    origin, extent = geometry['origin'], geometry['extent']
+    svg = ['<svg xmlns="http://www.w3.org/2000/svg" version="1.1" width="%d" height="%d" viewBox="%.3f %.3f %.3f %.3f">'
+           % (size, size, origin[0], origin[1], extent, extent)]
+    if bg != 't':
+        svg.append('<rect x="%.3f" y="%.3f" width="%.3f" height="%.3f" fill="%s"/>'
+                   % (origin[0], origin[1], extent, extent, bg))
+    for face in faces_to_draw(view):
+        svg.append('<g>')
+        svg.append('<polygon points="%s" fill="%s" fill-opacity="%.2f"/>'
+                   % (face_svg_points[face], cube_color, cube_opacity))
+        for i in range(9 * face, 9 * face + 9):
+            color = sticker_colors.get(fc[i])
+            if color is not None:
+                svg.append('<polygon points="%s" fill="%s" fill-opacity="%.2f"/>'
+                           % (sticker_svg_points[i], color, sticker_opacity))
+        svg.append('</g>')
+    svg.append('</svg>')
+    return ''.join(svg)
+
+
+# returns the sticker and face polygons in pixel coordinates of an image of the given size
+@functools.lru_cache(maxsize=16)
+def pixel_polygons(size: int):
+    scale = size / geometry['extent']
+    stickers = [[tuple(point) for point in polygon] for polygon in (geometry['stickers'] - geometry['origin']) * scale]
+    faces = [[tuple(point) for point in polygon] for polygon in (geometry['faces'] - geometry['origin']) * scale]
+    return stickers, faces
+
+
+# renders a Visual Cube 'fc' string as a PIL image
+def render_image(fc: str, size: int = 150, view=None, bg='white'):
+    check_view(view)
+    cube_opacity, sticker_opacity = view_opacity[view]
+    stickers, faces = pixel_polygons(size)
+    image = Image.new('RGBA', (size, size), (0, 0, 0, 0) if bg == 't' else bg)
+    for face in faces_to_draw(view):
+        if cube_opacity == 1 and sticker_opacity == 1:
+            layer = image
+        else:
+            layer = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(layer)
+        draw.polygon(faces[face], fill=cube_color + '%02x' % round(255 * cube_opacity))
+        for i in range(9 * face, 9 * face + 9):
+            color = sticker_colors.get(fc[i])
+            if color is not None:
+                draw.polygon(stickers[i], fill=color + '%02x' % round(255 * sticker_opacity))
+        if layer is not image:
+            image = Image.alpha_composite(image, layer)
+    return image
+
+
+# renders a Visual Cube 'fc' string as PNG bytes
+def render_png(fc: str, size: int = 150, view=None, bg='white'):
+    buffer = BytesIO()
+    render_image(fc, size, view, bg).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+# renders in the given format: 'svg' returns a string, 'png' returns bytes
+# raises ValueError for an unsupported view or an fc string that is not 54 stickers long
+def render(fc: str, size: int = 200, view=None, fmt='svg', bg='white'):
+    check_view(view)
+    if len(fc) != 54:
+        raise ValueError("fc must have 54 stickers, got %d" % len(fc))
+    if fmt == 'svg':
+        return render_svg(fc, size, view, bg)
+    return render_png(fc, size, view, bg)
+
+
+# extracts the render parameters from a Visual Cube URL such as the ones returned by Cube.viscube_image
+# returns a dict with keys 'fc', 'size', 'view', 'fmt' and 'bg'
+def url_to_params(url: str):
+    query = {key: values[0] for key, values in parse_qs(urlparse(url).query, keep_blank_values=True).items()}
+    fmt = query.get('fmt') or 'png'
+    return {
+        'fc': query.get('fc', ''),
+        'size': int(query.get('size', 128)),
+        'view': query.get('view'),
+        'fmt': 'svg' if fmt == 'svg' else 'png',
+        'bg': query.get('bg', 'white'),
+    }
+
+
+# renders a Visual Cube URL locally, without any network access
+def render_url(url: str):
+    return render(**url_to_params(url))
@@ -0,0 +1,131 @@
+import os
+import re
+import hashlib
+import tempfile
+from collections import OrderedDict
+from src import Render
+
+# names of the files written by a RenderCache: the sha1 key and the format, followed by a unique part and .tmp
+# for the temporary file of a writer
+cache_file_name = re.compile('[0-9a-f]{40}\\.[a-z]+(\\.[0-9a-z_]+\\.tmp)?')
+
+
+# renders through Render and returns bytes, SVG documents are UTF-8 encoded
+def local_renderer(fc: str, size: int, view, fmt: str):
+    image = Render.render(fc, size, view, fmt)
+    if type(image) == str:
+        image = image.encode('utf-8')
+    return image
+
+
+# content-addressed cache of rendered cube images, keyed on (facelet string, size, view, format)
+# an in-memory LRU tier sits in front of an on-disk tier whose total size is bounded
+# images missing from both tiers are produced by renderer(fc, size, view, fmt), which must return bytes
+class RenderCache:
+    def __init__(self, directory: str = None, memory_items: int = 1024, disk_bytes: int = 256 * 2 ** 20,
+                 renderer=local_renderer):
+        if directory is None:
+            directory = os.path.join(tempfile.gettempdir(), 'cubesim_render_cache')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.memory_items = memory_items
+        self.max_disk_bytes = disk_bytes
+        self.renderer = renderer
+        self.memory = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_bytes = sum(entry.stat().st_size for entry in self.entries())
+
+    @staticmethod
+    def key(fc: str, size: int, view, fmt: str):
+        return hashlib.sha1(('%s|%d|%s|%s' % (fc, size, view, fmt)).encode('ascii')).hexdigest()
+
+    # the files of the disk tier, other files in the directory are never counted or removed
+    def entries(self):
+        return [entry for entry in os.scandir(self.directory)
+                if entry.is_file() and cache_file_name.fullmatch(entry.name)]
+
+    def path(self, key: str, fmt: str):
+        return os.path.join(self.directory, key + '.' + fmt)
+
+    # returns the image bytes, rendering them only if they are in neither tier
+    def get(self, fc: str, size: int = 200, view=None, fmt: str = 'svg'):
+        key = self.key(fc, size, view, fmt)
+        image = self.memory.get(key)
+        if image is not None:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return image
+
+        path = self.path(key, fmt)
+        try:
+            with open(path, 'rb') as file:
+                image = file.read()
+            os.utime(path)      # the modification time orders files for eviction
+            self.disk_hits += 1
+        except FileNotFoundError:
+            image = self.renderer(fc, size, view, fmt)
+            self.misses += 1
+            self.write(path, image)
+        self.remember(key, image)
+        return image
+
+    # renders a Visual Cube URL, such as the ones returned by Cube.viscube_image, through the cache
+    def get_url(self, url: str):
+        params = Render.url_to_params(url)
+        return self.get(params['fc'], params['size'], params['view'], params['fmt'])
+
+    def remember(self, key: str, image: bytes):
+        self.memory[key] = image
+        if len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    # every writer has its own temporary file, so processes sharing the directory never write the same file
+    def write(self, path: str, image: bytes):
+        descriptor, temp_path = tempfile.mkstemp(suffix='.tmp', prefix=os.path.basename(path) + '.', dir=self.directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(image)
+            os.replace(temp_path, path)     # concurrent readers never see a partial file
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self.disk_bytes += len(image)
+        if self.disk_bytes > self.max_disk_bytes:
+            self.evict()
+
+    # removes the least recently used files until the disk tier is 90% of its maximum size
+    def evict(self):
+        entries = sorted(self.entries(), key=lambda entry: entry.stat().st_mtime)
+        self.disk_bytes = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self.disk_bytes <= 0.9 * self.max_disk_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self.disk_bytes -= size
+
+    # empties both tiers
+    def clear(self):
+        self.memory.clear()
+        for entry in self.entries():
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        self.disk_bytes = 0
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_ratio': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            'memory_items': len(self.memory),
+            'disk_bytes': self.disk_bytes,
+        }
@@ -0,0 +1,139 @@
+import math
+import numpy as np
+from src import Cube, Coordinates, CubeBatch
+
+# pieces that can be kept solved while the others are sampled, by name
+fixed_sets = {
+    'none': [],
+    'FB': ['FL', 'DL', 'BL', 'DFL', 'DBL'],
+    'F2B': ['FL', 'DL', 'BL', 'DFL', 'DBL', 'FR', 'DR', 'BR', 'DFR', 'DBR'],
+    'cross': ['DF', 'DR', 'DB', 'DL'],
+    'F2L': ['DF', 'DR', 'DB', 'DL', 'FR', 'FL', 'BL', 'BR', 'DFR', 'DLF', 'DBL', 'DRB'],
+}
+M_edges = ['UF', 'UB', 'DF', 'DB']
+default_block_size = 1 << 16
+solved_centers = Cube.solved_facelets[Coordinates.center_facelets]
+
+
+# returns the index of a piece in Coordinates.corner_names or edge_names and which of the two it is
+def find_piece(piece_str: str):
+    for kind, names in (('corner', Coordinates.corner_names), ('edge', Coordinates.edge_names)):
+        for index, name in enumerate(names):
+            if frozenset(name) == frozenset(piece_str):
+                return kind, index
+    raise ValueError("not a corner or an edge: " + piece_str)
+
+
+# random orientations (N, n) of the free pieces, fixed pieces stay at 0 and the orientations sum to 0 mod base
+def random_orientations(rng: np.random.Generator, rows: int, n: int, free: np.ndarray, base: int):
+    orientations = np.zeros((rows, n), dtype=np.int8)
+    if len(free) > 1:
+        orientations[:, free[:-1]] = rng.integers(0, base, (rows, len(free) - 1))
+        orientations[:, free[-1]] = -orientations.sum(axis=1) % base
+    return orientations
+
+
+def random_permutations(rng: np.random.Generator, rows: int, n: int, free: np.ndarray):
+    permutations = np.tile(np.arange(n, dtype=np.int8), (rows, 1))
+    if len(free) > 1:
+        permutations[:, free] = rng.permuted(np.tile(free.astype(np.int8), (rows, 1)), axis=1)
+    return permutations
+
+
+# draws uniformly random states straight from cubie permutations and orientations, without doing any moves
+# the pieces of fixed (a list of names or a key of fixed_sets) stay solved, all legal arrangements of the others
+# are equally likely: orientations sum to 0 and the corner and edge permutations have matching parities
+# with M_centers=True the M slice centers are also offset by a random M turn, as after F2B in Roux
+# (the M slice edges must then be free); states keep the centers of the solved Cube otherwise
+#
+# rows are drawn in blocks of block_size, block b from the seed sequence (seed, b), so row i is the same
+# state for a given seed however the rows are split between calls or worker processes
+class StateSampler:
+    def __init__(self, fixed='none', M_centers=False, seed: int = 0, block_size: int = default_block_size):
+        fixed = fixed_sets[fixed] if type(fixed) == str else list(fixed)
+        fixed_pieces = {'corner': set(), 'edge': set()}
+        for piece_str in fixed:
+            kind, index = find_piece(piece_str)
+            fixed_pieces[kind].add(index)
+        if M_centers and any(find_piece(edge_str)[1] in fixed_pieces['edge'] for edge_str in M_edges):
+            raise ValueError("M_centers needs the M slice edges " + str(M_edges) + " to be free")
+        self.fixed = fixed
+        self.M_centers = M_centers
+        self.seed = seed
+        self.block_size = block_size
+        self.free_corners = np.array([i for i in range(8) if i not in fixed_pieces['corner']], dtype=np.intp)
+        self.free_edges = np.array([i for i in range(12) if i not in fixed_pieces['edge']], dtype=np.intp)
+
+    # number of distinct states the sampler draws from
+    def size(self):
+        corners, edges = len(self.free_corners), len(self.free_edges)
+        size = math.factorial(corners) * math.factorial(edges) * 3 ** max(corners - 1, 0) * 2 ** max(edges - 1, 0)
+        if corners > 1 or edges > 1:
+            size //= 2
+        return size * (4 if self.M_centers else 1)
+
+    def rng(self, block: int):
+        return np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(block,)))
+
+    # returns the states of block b as an array (block_size, 54)
+    def block(self, block: int):
+        rng = self.rng(block)
+        rows = self.block_size
+        cp = random_permutations(rng, rows, 8, self.free_corners)
+        co = random_orientations(rng, rows, 8, self.free_corners, 3)
+        ep = random_permutations(rng, rows, 12, self.free_edges)
+        eo = random_orientations(rng, rows, 12, self.free_edges, 2)
+        M_turns = rng.integers(0, 4, rows) if self.M_centers else np.zeros(rows, dtype=np.intp)
+        mismatched = Coordinates.permutation_parities(cp) != Coordinates.permutation_parities(ep)
+        # swapping two free pieces pairs the odd and even arrangements one to one, which keeps the sample uniform
+        pieces, free = (ep, self.free_edges) if len(self.free_edges) > 1 else (cp, self.free_corners)
+        if mismatched.any():
+            pieces[np.ix_(mismatched, free[:2])] = pieces[np.ix_(mismatched, free[1::-1])]
+        states = Coordinates.cubies_to_facelets(cp, co, ep, eo, np.tile(solved_centers, (rows, 1)))
+        # M turns keep the fixed pieces in place, so turning a uniform sample keeps it uniform
+        for magnitude in range(1, 4):
+            turned = M_turns == magnitude
+            states[turned] = states[turned][:, Cube.move_tables['M'][magnitude]]
+        return states
+
+    # returns rows start to start + n as an array (n, 54), filled block by block into out if given
+    def sample(self, n: int, start: int = 0, out: np.ndarray = None):
+        if out is None:
+            out = np.empty((n, 54), dtype=np.uint8)
+        row = start
+        while row < start + n:
+            block, offset = divmod(row, self.block_size)
+            count = min(self.block_size - offset, start + n - row)
+            out[row - start:row - start + count] = self.block(block)[offset:offset + count]
+            row += count
+        return out
+
+    def batch(self, n: int, start: int = 0):
+        return CubeBatch.CubeBatch(self.sample(n, start))
+
+
+# returns a scramble string for a state drawn by a StateSampler, found with the two-phase solver
+# the M slice offset of the centers, if any, is undone first and done at the end of the scramble
+# raises ValueError if the solver finds no solution within the timeout
+def scramble(state: np.ndarray, target_length: int = 22, timeout: float = 10):
+    from src import Solver, Simplify
+    M_turns = [magnitude for magnitude in range(4)
+               if (Cube.solved_facelets[Cube.move_tables['M'][magnitude]][Coordinates.center_facelets]
+                   == np.asarray(state)[Coordinates.center_facelets]).all()]
+    if not M_turns:
+        raise ValueError("the centers are not solved up to an M turn")
+    cube = Cube.Cube()
+    cube.set_state(np.asarray(state)[Cube.move_tables['M'][-M_turns[0] % 4]])
+    solution = Solver.solve(cube, target_length, timeout)['solution']
+    if solution is None:
+        raise ValueError("no solution found within %g seconds" % timeout)
+    return (Simplify.invert_moves(solution) + ' ' + ['', 'M', 'M2', "M'"][M_turns[0]]).strip()
+
+
+def scrambles(states: np.ndarray, target_length: int = 22, timeout: float = 10):
+    return [scramble(state, target_length, timeout) for state in np.atleast_2d(states)]
+
+
+# returns n uniformly random states (n, 54), see StateSampler
+def sample_states(n: int, fixed='none', M_centers=False, seed: int = 0, start: int = 0):
+    return StateSampler(fixed, M_centers, seed).sample(n, start)
@@ -0,0 +1,124 @@
+import functools
+import itertools
+from src import Cube
+
+metrics = ['HTM', 'STM', 'ETM']
+magnitude_suffixes = {1: '', 2: '2', 3: "'"}
+
+
+# every move turns some of the three layers of its axis, as in Cube.init_move_tables
+# returns the turns of the layers (indexed by slice_to_index) in the positive direction of the axis, mod 4
+def get_layer_turns(move: str, magnitude: int = 1):
+    upper = move.upper()
+    if upper in Cube.axis_keys:
+        layers = [0, 1, 2]
+    elif upper in Cube.slice_keys:
+        layers = [1]
+    else:
+        layers = [Cube.slice_to_index[move]] if move.isupper() else [Cube.slice_to_index[upper], 1]
+    direction = 1 if upper in Cube.positive_moves else -1
+    return tuple(direction * magnitude % 4 if layer in layers else 0 for layer in range(3))
+
+
+# the moves of each axis used to write simplified sequences, in the order they are written
+def get_axis_moves(axis: str):
+    faces = [face for face in Cube.face_keys if Cube.move_to_axis[face] == axis]
+    layer_slice = [key for key in Cube.slice_keys if Cube.move_to_axis[key] == axis]
+    return faces + layer_slice + [face.lower() for face in faces] + [axis.lower()]
+
+
+# cost of a single move in a metric: HTM counts slices as two turns, HTM and STM do not count rotations
+def move_cost(move: str, metric: str):
+    if metric not in metrics:
+        raise ValueError("unknown metric " + metric + ", use one of " + str(metrics))
+    upper = move.upper()
+    if metric == 'ETM':
+        return 1
+    if upper in Cube.axis_keys:
+        return 0
+    if upper in Cube.slice_keys and metric == 'HTM':
+        return 2
+    return 1
+
+
+# for each axis and metric, the cheapest way to write every combination of layer turns
+# ties are broken by the number of moves, then by using fewer wide moves and rotations, then fewer slice moves
+# rotations are only used if allowed, so a simplified sequence has none unless the original had some
+@functools.lru_cache(maxsize=None)
+def get_expressions(axis: str, metric: str, rotations: bool):
+    axis_moves = get_axis_moves(axis)
+    if not rotations:
+        axis_moves = axis_moves[:-1]
+    best = dict()
+    for magnitudes in itertools.product(range(4), repeat=len(axis_moves)):
+        turns = [0, 0, 0]
+        cost = 0
+        moves = []
+        for move, magnitude in zip(axis_moves, magnitudes):
+            if magnitude:
+                move_turns = get_layer_turns(move, magnitude)
+                turns = [(a + b) % 4 for a, b in zip(turns, move_turns)]
+                cost += move_cost(move, metric)
+                moves.append(move + magnitude_suffixes[magnitude])
+        key = (cost, len(moves), sum(move[0].islower() for move in moves), sum(move[0] in Cube.slice_keys for move in moves))
+        if tuple(turns) not in best or key < best[tuple(turns)][0]:
+            best[tuple(turns)] = (key, moves)
+    return {turns: moves for turns, (_, moves) in best.items()}
+
+
+# simplifies a parsed move list of form [[move, magnitude], ...] into a list of move strings
+# consecutive moves on one axis commute, so each run of them is summed per layer and written in its cheapest form;
+# a run that cancels out lets the runs around it meet and merge, e.g. "R U U' R'" -> ""
+def simplify_move_list(move_list, metric: str = 'STM'):
+    runs = []       # [axis, layer turns, has a rotation] of the simplified runs so far
+    for move, magnitude in move_list:
+        axis = Cube.move_to_axis[move.upper()]
+        turns = get_layer_turns(move, magnitude)
+        rotation = move.upper() in Cube.axis_keys
+        if runs and runs[-1][0] == axis:
+            runs[-1][1] = tuple((a + b) % 4 for a, b in zip(runs[-1][1], turns))
+            runs[-1][2] = runs[-1][2] or rotation
+            if runs[-1][1] == (0, 0, 0):
+                runs.pop()
+        elif turns != (0, 0, 0):
+            runs.append([axis, turns, rotation])
+    simplified = []
+    for axis, turns, rotation in runs:
+        simplified += get_expressions(axis, metric, rotation)[turns]
+    return simplified
+
+
+# returns an equivalent, simplified move string, e.g. "U U R L R' U'" -> "U2 L U'"
+# only moves that meet on the same axis are combined, so the result is locally (not globally) minimal
+# raises ValueError if the string can not be parsed
+@functools.lru_cache(maxsize=Cube.compile_cache_size)
+def simplify_normalized_moves(move_str: str, metric: str = 'STM'):
+    parsed, moves = Cube.parse_moves(move_str)
+    if not parsed:
+        raise ValueError("can not parse moves: " + move_str)
+    return ' '.join(simplify_move_list(moves, metric))
+
+
+def simplify_moves(move_str: str, metric: str = 'STM'):
+    return simplify_normalized_moves(Cube.normalize_moves(move_str), metric)
+
+
+# returns the move string undoing move_str, e.g. "R U2 M'" -> "M U2 R'"
+# raises ValueError if the string can not be parsed
+def invert_moves(move_str: str):
+    parsed, moves = Cube.parse_moves(move_str)
+    if not parsed:
+        raise ValueError("can not parse moves: " + move_str)
+    return ' '.join(move + magnitude_suffixes[-magnitude % 4] for move, magnitude in reversed(moves) if magnitude % 4)
+
+
+# returns the length of a move string in a metric
+def move_count(move_str: str, metric: str = 'STM'):
+    parsed, moves = Cube.parse_moves(move_str)
+    if not parsed:
+        raise ValueError("can not parse moves: " + move_str)
+    return sum(move_cost(move, metric) for move, magnitude in moves if magnitude % 4)
+
+
+def move_counts(move_str: str):
+    return {metric: move_count(move_str, metric) for metric in metrics}
@@ -0,0 +1,409 @@
+import time
+import hashlib
+import functools
+import numpy as np
+from src import Cube, Analysis, Coordinates
+
+# names of moves as written in move strings, indexed like Coordinates.coordinate_moves
+move_strings = [name[0] + {'1': '', '2': '2', '3': "'"}[name[1]] for name in Coordinates.coordinate_moves]
+opposite_faces = {'U': 'D', 'D': 'U', 'R': 'L', 'L': 'R', 'F': 'B', 'B': 'F'}
+# moves of phase 2 of the two-phase solver, they keep corner and edge orientation and the slice edges in the slice
+phase2_moves = [Coordinates.coordinate_move_index[name] for name in
+                ['U1', 'U2', 'U3', 'D1', 'D2', 'D3', 'R2', 'L2', 'F2', 'B2']]
+solved_slice_combination = 494     # the slice edges on the slice positions
+
+
+# breadth first search over a dense state space, distances are stored as uint8 with 255 for unreached states
+# expand maps an array of state indices to an array of shape (moves, states) of their neighbors
+def bfs_table(size: int, goals, expand):
+    table = np.full(size, 255, dtype=np.uint8)
+    frontier = np.unique(np.asarray(goals, dtype=np.int64))
+    table[frontier] = 0
+    depth = 0
+    while frontier.size:
+        neighbors = expand(frontier).ravel()
+        neighbors = np.unique(neighbors[table[neighbors] == 255])
+        depth += 1
+        table[neighbors] = depth
+        frontier = neighbors
+    return table
+
+
+def skip_move(face: str, previous_face: str):
+    # never turn the same face twice in a row, and turn opposite faces in one fixed order only
+    return face == previous_face or (previous_face is not None and opposite_faces[face] == previous_face and face in 'DLB')
+
+
+# ---- two-phase solver for the whole cube ----
+
+def get_slice_combination_table():
+    slice_table = np.asarray(Coordinates.get_move_table('slice'))
+    return slice_table[np.arange(495) * 24] // 24
+
+
+def get_slice_permutation_table():
+    slice_table = np.asarray(Coordinates.get_move_table('slice'))
+    return slice_table[solved_slice_combination * 24 + np.arange(24)] % 24
+
+
+# permutation of the 8 U and D edges, only meaningful in phase 2 where the slice edges stay in the slice
+def build_UD8_table():
+    values = np.arange(40320)
+    edge_permutations = np.empty((len(values), 12), dtype=np.intp)
+    edge_permutations[:, :8] = Coordinates.unrank_permutations(values, 8)
+    edge_permutations[:, 8:] = np.arange(8, 12)
+    table = np.zeros((len(values), len(Coordinates.coordinate_moves)), dtype=np.uint16)
+    for move_index in phase2_moves:
+        moved = Coordinates.apply_permutation_move(edge_permutations, Coordinates.edge_moves[move_index])
+        table[:, move_index] = Coordinates.rank_permutations(moved[:, :8])
+    return table
+
+
+@functools.lru_cache(maxsize=None)
+def get_two_phase_tables():
+    CO = np.asarray(Coordinates.get_move_table('CO'))
+    EO = np.asarray(Coordinates.get_move_table('EO'))
+    CP = np.asarray(Coordinates.get_move_table('CP'))
+    combination = get_slice_combination_table()
+    slice_permutation = get_slice_permutation_table()
+    UD8 = np.asarray(Coordinates.cached_table('move_UD8', build_UD8_table))
+    all_moves = np.arange(len(Coordinates.coordinate_moves))
+
+    def pruning(name, first_table, second_table, moves, goal):
+        second_size = len(second_table)
+
+        def expand(indices):
+            first, second = np.divmod(indices, second_size)
+            return (first_table[first][:, moves].astype(np.int64) * second_size + second_table[second][:, moves]).T
+
+        return np.asarray(Coordinates.cached_table(name, lambda: bfs_table(len(first_table) * second_size, [goal], expand)))
+
+    tables = {
+        'CO': CO, 'EO': EO, 'CP': CP, 'UD8': UD8, 'slice': combination, 'slice_permutation': slice_permutation,
+        'CO_slice': pruning('prune_CO_slice', CO, combination, all_moves, solved_slice_combination),
+        'EO_slice': pruning('prune_EO_slice', EO, combination, all_moves, solved_slice_combination),
+        'CP_slice': pruning('prune_CP_slice', CP, slice_permutation, phase2_moves, 0),
+        'UD8_slice': pruning('prune_UD8_slice', UD8, slice_permutation, phase2_moves, 0),
+    }
+    # flat memoryviews index to plain ints without copying the mapped tables, move tables are read at [i * 18 + move]
+    return {name: memoryview(np.ascontiguousarray(table).ravel()) for name, table in tables.items()}
+
+
+# raised inside the search when it runs out of time or nodes
+class SearchLimit(Exception):
+    pass
+
+
+# near-optimal two-phase solver (Kociemba's algorithm) over the 18 face turns
+# solutions are improved until one has at most target_length moves or until timeout seconds have passed
+# the timeout and max_nodes also stop a search that has not found any solution yet
+class TwoPhaseSolver:
+    def __init__(self):
+        self.tables = get_two_phase_tables()
+        self.nodes = 0
+        self.deadline = None
+        self.max_nodes = None
+
+    # counts a node, the clock is read every 1024 nodes
+    def count_node(self):
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SearchLimit()
+        if not self.nodes & 1023 and time.perf_counter() > self.deadline:
+            raise SearchLimit()
+
+    def phase1(self, co, eo, combination, depth, previous_face, path):
+        self.count_node()
+        tables = self.tables
+        if depth == 0:
+            if co == 0 and eo == 0 and combination == solved_slice_combination:
+                yield path
+            return
+        if max(tables['CO_slice'][co * 495 + combination], tables['EO_slice'][eo * 495 + combination]) > depth:
+            return
+        for move_index, move in enumerate(move_strings):
+            if skip_move(move[0], previous_face):
+                continue
+            # a phase 1 solution ending in a phase 2 move is found again from a shorter one
+            if depth == 1 and move_index in phase2_moves and path:
+                continue
+            path.append(move_index)
+            yield from self.phase1(tables['CO'][co * 18 + move_index], tables['EO'][eo * 18 + move_index],
+                                   tables['slice'][combination * 18 + move_index], depth - 1, move[0], path)
+            path.pop()
+
+    def phase2(self, cp, ud8, slice_permutation, depth, previous_face, path):
+        self.count_node()
+        tables = self.tables
+        if cp == 0 and ud8 == 0 and slice_permutation == 0:
+            return True
+        if depth == 0 or max(tables['CP_slice'][cp * 24 + slice_permutation],
+                             tables['UD8_slice'][ud8 * 24 + slice_permutation]) > depth:
+            return False
+        for move_index in phase2_moves:
+            move = move_strings[move_index]
+            if skip_move(move[0], previous_face):
+                continue
+            path.append(move_index)
+            if self.phase2(tables['CP'][cp * 18 + move_index], tables['UD8'][ud8 * 18 + move_index],
+                           tables['slice_permutation'][slice_permutation * 18 + move_index], depth - 1, move[0], path):
+                return True
+            path.pop()
+        return False
+
+    # returns a dict with the solution string, its length, nodes expanded and solve time in seconds
+    # the solution is the best one found within timeout seconds and max_nodes nodes, None if none was found
+    # raises ValueError if the cube can not be solved (a twisted corner, a flipped edge or two swapped pieces)
+    def solve(self, cube: Cube.Cube, target_length: int = 22, timeout: float = 10, max_nodes: int = None):
+        start = time.perf_counter()
+        self.nodes = 0
+        self.deadline = start + timeout
+        self.max_nodes = max_nodes
+        cp, co, ep, eo = Coordinates.facelets_to_cubies(cube.facelets)
+        Coordinates.check_cubies(cp, co, ep, eo)
+        coordinates = Coordinates.cubies_to_coordinates(cp, co, ep, eo)
+        co, eo = int(coordinates['CO'][0]), int(coordinates['EO'][0])
+        combination = int(coordinates['slice'][0]) // 24
+        self.best = None
+        try:
+            self.search(cube, co, eo, combination, target_length)
+        except SearchLimit:
+            pass
+        return self.result(self.best, start)
+
+    # keeps the best solution in self.best, count_node raises SearchLimit when the time or nodes run out
+    def search(self, cube: Cube.Cube, co: int, eo: int, combination: int, target_length: int):
+        depth1 = 0
+        while self.best is None or depth1 < len(self.best):
+            for path in self.phase1(co, eo, combination, depth1, None, []):
+                # phase 2 starts from the cube after the phase 1 moves
+                phase1_str = ' '.join(move_strings[move_index] for move_index in path)
+                state = cube.facelets[Cube.compile_moves(phase1_str)[2]]
+                cp2, _, ep2, _ = Coordinates.facelets_to_cubies(state)
+                slice_permutation = int(Coordinates.rank_edge_subsets(ep2, Coordinates.edge_subsets['slice'])[0]) % 24
+                max_depth2 = 18 if self.best is None else len(self.best) - len(path) - 1
+                previous_face = move_strings[path[-1]][0] if path else None
+                for depth2 in range(max_depth2 + 1):
+                    phase2_path = []
+                    if self.phase2(int(Coordinates.rank_permutations(cp2)[0]), int(Coordinates.rank_permutations(ep2[:, :8])[0]),
+                                   slice_permutation, depth2, previous_face, phase2_path):
+                        self.best = path + phase2_path
+                        break
+                if self.best is not None and len(self.best) <= target_length:
+                    return
+            depth1 += 1
+
+    def result(self, path, start):
+        return {
+            'solution': ' '.join(move_strings[move_index] for move_index in path) if path is not None else None,
+            'length': len(path) if path is not None else None,
+            'nodes': self.nodes,
+            'time': time.perf_counter() - start,
+        }
+
+
+# ---- pattern databases and IDA* for subsets of pieces (Roux steps) ----
+
+# the facelet holding the reference sticker of a piece, centers are named by their face
+def reference_facelet(piece: str):
+    if len(piece) == 1:
+        return 9 * Cube.face_keys.index(piece) + 4
+    return int(Analysis.reference_facelets[Analysis.name_to_piece[Analysis.piece_name(piece)]])
+
+
+# a pattern database: the exact distance to solved of every arrangement of a few pieces under a set of moves
+# each piece is tracked by the facelet its reference sticker is on, which gives both its position and orientation
+class PatternDatabase:
+    def __init__(self, name: str, pieces: list, moves: list):
+        self.name = name
+        self.pieces = pieces
+        self.moves = moves
+        # destinations[m][s] is where the sticker on facelet s goes with move m
+        self.destinations = np.array([np.argsort(Cube.compile_moves(move)[2]) for move in moves])
+        self.homes = [reference_facelet(piece) for piece in pieces]
+
+        # facelets reachable by each piece, the table has one entry per combination of them
+        self.spots = []
+        for home in self.homes:
+            reached = {home}
+            frontier = [home]
+            while frontier:
+                frontier = [int(d) for d in self.destinations[:, frontier].ravel() if int(d) not in reached]
+                reached.update(frontier)
+            self.spots.append(sorted(reached))
+        self.radices = [len(spots) for spots in self.spots]
+        self.strides = [int(np.prod(self.radices[k + 1:])) for k in range(len(self.pieces))]
+        self.size = int(np.prod(self.radices))
+        # per piece: spot -> local index * stride, and local index -> local index after each move
+        self.spot_values = []
+        self.local_moves = []
+        for spots, stride in zip(self.spots, self.strides):
+            local = np.full(54, -1, dtype=np.int64)
+            local[spots] = np.arange(len(spots))
+            self.spot_values.append({spot: index * stride for index, spot in enumerate(spots)})
+            self.local_moves.append(local[self.destinations[:, spots]])
+        # the file name carries a digest of the definition so that a changed database is rebuilt
+        digest = hashlib.sha1(repr((pieces, moves)).encode('utf-8')).hexdigest()[:10]
+        self.table = np.asarray(Coordinates.cached_table('pattern_%s_%s' % (name, digest), self.build))
+
+    def index(self, spots):
+        return sum(values[spot] for values, spot in zip(self.spot_values, spots))
+
+    def build(self):
+        goal = sum(self.spots[k].index(home) * stride for k, (home, stride) in enumerate(zip(self.homes, self.strides)))
+
+        def expand(indices):
+            neighbors = np.zeros((len(self.moves), len(indices)), dtype=np.int64)
+            remaining = indices.copy()
+            for local_moves, radix, stride in zip(self.local_moves, self.radices, self.strides):
+                digit, remaining = np.divmod(remaining, stride)
+                neighbors += local_moves[:, digit] * stride
+            return neighbors
+
+        return bfs_table(self.size, [goal], expand)
+
+
+# returns the facelet each piece's reference sticker is on, recognizing pieces by their colors
+# the color of each face comes from stickers that none of the moves move, the one face left over takes the remaining color
+def find_pieces(facelets: np.ndarray, pieces: list, moves: list):
+    fixed = np.ones(54, dtype=bool)
+    for move in moves:
+        fixed &= Cube.compile_moves(move)[2] == np.arange(54)
+    face_colors = dict()
+    for facelet in np.nonzero(fixed)[0]:
+        face_colors.setdefault(Cube.facelet_coords[facelet][3], facelets[facelet])
+    missing = [face for face in Cube.face_keys if face not in face_colors]
+    if len(missing) == 1:
+        face_colors[missing[0]] = (set(facelets[Coordinates.center_facelets]) - set(face_colors.values())).pop()
+    elif missing:
+        face_colors = dict(zip(Cube.face_keys, facelets[Coordinates.center_facelets]))
+
+    spots = []
+    for piece in pieces:
+        if len(piece) == 1:
+            candidates = [int(facelet) for facelet in Coordinates.center_facelets if facelets[facelet] == face_colors[piece]]
+        else:
+            name = Analysis.piece_name(piece)
+            colors = sorted(face_colors[face] for face in name)
+            candidates = []
+            for facelet_list in Analysis.piece_facelets:
+                if len(facelet_list) == len(name) and sorted(facelets[facelet_list]) == colors:
+                    candidates += [facelet for facelet in facelet_list if facelets[facelet] == face_colors[name[0]]]
+        if len(candidates) != 1:
+            raise ValueError("cannot locate piece " + piece + ", it may be masked")
+        spots.append(candidates[0])
+    return spots
+
+
+# IDA* over a set of moves, using the maximum over pattern databases as heuristic
+# the goal is reached when every database reads 0, so the databases must cover all pieces of the step
+class SubsetSolver:
+    def __init__(self, databases: list, moves: list):
+        self.databases = databases
+        self.moves = moves
+        self.destinations = [np.argsort(Cube.compile_moves(move)[2]).tolist() for move in moves]
+        self.pieces = []
+        for database in databases:
+            self.pieces += [piece for piece in database.pieces if piece not in self.pieces]
+        self.database_pieces = [[self.pieces.index(piece) for piece in database.pieces] for database in databases]
+        self.nodes = 0
+
+    def heuristic(self, spots):
+        return max(database.table[database.index([spots[k] for k in pieces])]
+                   for database, pieces in zip(self.databases, self.database_pieces))
+
+    def search(self, spots, depth, previous_letter, path):
+        self.nodes += 1
+        h = self.heuristic(spots)
+        if h == 0:
+            return True
+        if h > depth or self.nodes > self.max_nodes:
+            return False
+        for move_index, move in enumerate(self.moves):
+            if move[0] == previous_letter:
+                continue
+            destination = self.destinations[move_index]
+            path.append(move)
+            if self.search([destination[spot] for spot in spots], depth - 1, move[0], path):
+                return True
+            path.pop()
+        return False
+
+    # returns a dict with the solution string (None if not found), its length, nodes expanded and solve time
+    def solve(self, cube: Cube.Cube, max_length: int = 20, max_nodes: int = 10 ** 7):
+        start = time.perf_counter()
+        self.nodes = 0
+        self.max_nodes = max_nodes
+        spots = find_pieces(cube.facelets, self.pieces, self.moves)
+        path = []
+        found = False
+        for depth in range(max_length + 1):
+            if self.search(spots, depth, None, path):
+                found = True
+                break
+            if self.nodes > max_nodes:
+                break
+        return {
+            'solution': ' '.join(path) if found else None,
+            'length': len(path) if found else None,
+            'nodes': self.nodes,
+            'time': time.perf_counter() - start,
+        }
+
+
+def with_magnitudes(letters: str):
+    return [letter + suffix for letter in letters for suffix in ('', '2', "'")]
+
+
+face_turns = with_magnitudes('URFDLB')
+first_block = ['FL', 'DL', 'BL', 'DFL', 'DBL']
+second_block = ['FR', 'DR', 'BR', 'DFR', 'DBR']
+CMLL_corners = ['UFL', 'UFR', 'UBL', 'UBR']
+LSE_pieces = ['UF', 'UR', 'UB', 'UL', 'DF', 'DB', 'U']
+
+# Roux steps: the pattern databases that define each step and the moves used to solve it
+# blocks are on L and R with the cube held as it is, so rotate the cube first if needed (e.g. 'y z2')
+step_definitions = {
+    'FB': ([('FB', first_block, face_turns)], face_turns),
+    'SB': ([('SB_RrUM', second_block, with_magnitudes('RrUM'))], with_magnitudes('RrUM')),
+    'CMLL': ([('CMLL', CMLL_corners, with_magnitudes('URFLD')), ('FB', first_block, face_turns),
+              ('SB', second_block, face_turns)], with_magnitudes('URFLD')),
+    'LSE': ([('LSE', LSE_pieces, with_magnitudes('UM'))], with_magnitudes('UM')),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_pattern_database(name: str, pieces: tuple, moves: tuple):
+    return PatternDatabase(name, list(pieces), list(moves))
+
+
+@functools.lru_cache(maxsize=None)
+def get_step_solver(step: str):
+    databases, moves = step_definitions[step]
+    return SubsetSolver([get_pattern_database(name, tuple(pieces), tuple(database_moves))
+                         for name, pieces, database_moves in databases], moves)
+
+
+# solves a Roux step ('FB', 'SB', 'F2B', 'CMLL' or 'LSE') from the current state of the cube
+# F2B is solved as FB followed by SB with <R, r, U, M>, which keeps the first block
+def solve_step(cube: Cube.Cube, step: str, max_length: int = 20, max_nodes: int = 10 ** 7):
+    if step == 'F2B':
+        first = solve_step(cube, 'FB', max_length, max_nodes)
+        if first['solution'] is None:
+            return first
+        after_first = Cube.Cube()
+        after_first.set_state(cube.facelets)
+        after_first.do_moves(first['solution'])
+        second = solve_step(after_first, 'SB', max_length, max_nodes)
+        solved = second['solution'] is not None
+        return {
+            'solution': (first['solution'] + ' ' + second['solution']).strip() if solved else None,
+            'length': first['length'] + second['length'] if solved else None,
+            'nodes': first['nodes'] + second['nodes'],
+            'time': first['time'] + second['time'],
+        }
+    return get_step_solver(step).solve(cube, max_length, max_nodes)
+
+
+def solve(cube: Cube.Cube, target_length: int = 22, timeout: float = 10, max_nodes: int = None):
+    return TwoPhaseSolver().solve(cube, target_length, timeout, max_nodes)
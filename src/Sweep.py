@@ -0,0 +1,171 @@
+import os
+import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from src import Cube, Symmetry, Instrument
+
+
+# analyses take (cube, setup, algorithm) with the cube in the base state and return a picklable result
+def facelets_analysis(cube: Cube.Cube, setup: str, algorithm: str):
+    cube.do_moves(setup)
+    cube.do_moves(algorithm)
+    return cube.get_facelets_string()
+
+
+def EO_mask_analysis(cube: Cube.Cube, setup: str, algorithm: str):
+    cube.do_moves(setup)
+    cube.do_moves(algorithm)
+    return cube.EO_mask(cube.facelets)
+
+
+# the setup is everything done before the CMLL, e.g. EO case setup + " " + CMLL setup
+def CMLL_affects_EO_analysis(cube: Cube.Cube, setup: str, algorithm: str):
+    return cube.CMLL_affects_EO(algorithm, setup, '')
+
+
+analyses = {
+    'facelets': facelets_analysis,
+    'EO_mask': EO_mask_analysis,
+    'CMLL_affects_EO': CMLL_affects_EO_analysis,
+}
+
+# the name of an analysis in results and for unique_jobs: its key in analyses, or the __name__ of a function,
+# or the repr of a functools.partial or callable object (which includes its arguments for a partial)
+def analysis_name(analysis):
+    if type(analysis) == str:
+        return analysis
+    return getattr(analysis, '__name__', repr(analysis))
+
+
+# per-process cube and base state, set up once by init_worker
+worker_cube = None
+worker_base = None
+
+
+def init_worker(base_state: bytes, instrument=False):
+    global worker_cube, worker_base
+    if instrument:
+        Instrument.enable(instrument == 'trace')
+    worker_base = base_state
+    worker_cube = Cube.Cube()
+    worker_cube.restore(base_state)
+
+
+# runs a chunk of jobs of form (setup, algorithm, analysis) on the worker cube
+# analysis is a name from analyses or a picklable function
+def run_chunk(chunk: list):
+    results = []
+    for setup, algorithm, analysis in chunk:
+        if type(analysis) == str:
+            analysis = analyses[analysis]
+        worker_cube.restore(worker_base)
+        results.append(analysis(worker_cube, setup, algorithm))
+    return results
+
+
+# run_chunk for instrumented sweeps: the worker's counters are sent back with the results and cleared
+def run_chunk_instrumented(chunk: list):
+    return run_chunk(chunk), Instrument.collect()
+
+
+def get_base_state(base):
+    if base is None:
+        return Cube.Cube().snapshot()
+    if isinstance(base, Cube.Cube):
+        return base.snapshot()
+    return bytes(base)
+
+
+# yields only the jobs whose state after the setup is new for their algorithm and analysis, so that repeated
+# cases are run once. by default states must be identical; table can be a Symmetry.TranspositionTable that also
+# folds symmetries or AUF (e.g. TranspositionTable('U', auf=True)), but the algorithm is not transformed with the
+# state, so only do that for analyses whose result provably does not change under those transforms
+def unique_jobs(jobs, base=None, table: Symmetry.TranspositionTable = None):
+    if table is None:
+        table = Symmetry.TranspositionTable(None, exact=True)
+    base_state = get_base_state(base)
+    cube = Cube.Cube()
+    for setup, algorithm, analysis in jobs:
+        cube.restore(base_state)
+        cube.do_moves(setup)
+        if not table.seen(cube.facelets, tag=(algorithm, analysis_name(analysis))):
+            yield setup, algorithm, analysis
+
+
+# runs (setup, algorithm, analysis) jobs on copies of a base state (a Cube, a snapshot or None for solved)
+# jobs are sharded in chunks over a process pool and results are yielded as (index, job, result) in job order
+# workers=0 runs everything in the current process
+# instrument=True (or 'trace' to also keep trace events) instruments the workers and merges their counters into
+# Instrument in this process, for Instrument.report() or Instrument.write_chrome_trace() after the sweep
+def run_sweep(jobs, base=None, workers: int = None, chunk_size: int = 64, instrument=False):
+    base_state = get_base_state(base)
+    jobs = iter(jobs)
+
+    def chunks():
+        chunk = []
+        for job in jobs:
+            chunk.append(tuple(job))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    if workers == 0:
+        was_enabled = Instrument.enabled
+        init_worker(base_state, instrument)
+        try:
+            index = 0
+            for chunk in chunks():
+                for job, result in zip(chunk, run_chunk(chunk)):
+                    yield index, job, result
+                    index += 1
+        finally:
+            if instrument and not was_enabled:
+                Instrument.disable()
+        return
+
+    def chunk_results(future):
+        if not instrument:
+            return future.result()
+        results, counters = future.result()
+        Instrument.merge(counters)
+        return results
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    run = run_chunk_instrumented if instrument else run_chunk
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(base_state, instrument)) as executor:
+        in_flight = deque()      # a bounded window of submitted chunks, consumed in submission order
+        index = 0
+        for chunk in chunks():
+            in_flight.append((chunk, executor.submit(run, chunk)))
+            if len(in_flight) >= 4 * workers:
+                chunk, future = in_flight.popleft()
+                for job, result in zip(chunk, chunk_results(future)):
+                    yield index, job, result
+                    index += 1
+        while in_flight:
+            chunk, future = in_flight.popleft()
+            for job, result in zip(chunk, chunk_results(future)):
+                yield index, job, result
+                index += 1
+
+
+# writes the results of run_sweep as JSON lines to a path or an open text file, returns the number of lines
+def write_jsonl(results, output):
+    file = open(output, 'w') if type(output) == str else output
+    count = 0
+    try:
+        for index, (setup, algorithm, analysis), result in results:
+            file.write(json.dumps({'index': index, 'setup': setup, 'algorithm': algorithm,
+                                   'analysis': analysis_name(analysis), 'result': result}) + '\n')
+            count += 1
+    finally:
+        if file is not output:
+            file.close()
+    return count
+
+
+def sweep_to_jsonl(jobs, output, base=None, workers: int = None, chunk_size: int = 64, instrument=False):
+    return write_jsonl(run_sweep(jobs, base, workers, chunk_size, instrument), output)
@@ -0,0 +1,213 @@
+import numpy as np
+from src import Cube
+
+center_facelets = np.array([9 * face + 4 for face in range(6)])
+hash_chunk_rows = 4096      # rows canonicalized at once, bounds the (rows, candidates, 54) working array
+
+
+# left-right mirror as a facelet permutation: x -> 2 - x and the R and L faces swapped
+def init_mirror():
+    swap = {'R': 'L', 'L': 'R'}
+    return np.array([Cube.coords_to_facelets[(y, 2 - x, z)][swap.get(face, face)]
+                     for y, x, z, face in Cube.facelet_coords], dtype=np.intp)
+
+
+# the 48 symmetries of the cube as facelet gathers, the 24 rotations first and then the same rotations mirrored
+# the rotations are found by a breadth first search over x and y, each named by a rotation sequence reaching it
+def init_symmetries():
+    identity = np.arange(54)
+    names = ['']
+    permutations = [identity]
+    seen = {identity.tobytes()}
+    frontier = [('', identity)]
+    while frontier:
+        next_frontier = []
+        for name, permutation in frontier:
+            for rotation in ['X', 'Y']:
+                new_permutation = permutation[Cube.move_tables[rotation][1]]
+                if new_permutation.tobytes() not in seen:
+                    seen.add(new_permutation.tobytes())
+                    new_name = (name + ' ' + rotation).strip()
+                    names.append(new_name)
+                    permutations.append(new_permutation)
+                    next_frontier.append((new_name, new_permutation))
+        frontier = next_frontier
+    mirror = init_mirror()
+    names += [(name + ' mirror').strip() for name in names]
+    permutations += [permutation[mirror] for permutation in permutations]
+    permutations = np.array(permutations, dtype=np.intp)
+    permutations.setflags(write=False)
+    return names, permutations
+
+
+symmetry_names, symmetry_permutations = init_symmetries()
+
+# subgroups usable for canonicalization, by name
+# symmetries that keep the U center on U also map U turns to U turns, so only those combine with AUF
+U_symmetries = [i for i, permutation in enumerate(symmetry_permutations) if permutation[4] == 4]
+symmetry_groups = {
+    None: [0],
+    'y': [i for i in U_symmetries if 'mirror' not in symmetry_names[i]],
+    'U': U_symmetries,
+    'all': list(range(len(symmetry_permutations))),
+}
+AUF_permutations = np.array(Cube.move_tables['U'])
+
+
+# returns the candidate permutations for a symmetry group, with the AUF turns done before the symmetry if auf is set
+# pre-AUF is a U turn of the state, post-AUF is covered by the y symmetries (for states that only differ in the U layer
+# U^a X U^b equals U^(a+b) conjugated by y^b)
+def get_candidate_permutations(symmetries='all', auf=False):
+    if symmetries not in symmetry_groups:
+        raise ValueError("unknown symmetry group " + str(symmetries) + ", use one of " + str(list(symmetry_groups)))
+    group = symmetry_groups[symmetries]
+    if not auf:
+        return symmetry_permutations[group]
+    if not set(group) <= set(U_symmetries):
+        raise ValueError("AUF canonicalization needs a symmetry group that keeps the U face, use 'y' or 'U'")
+    return np.array([turn[symmetry_permutations[s]] for turn in AUF_permutations for s in group])
+
+
+# conjugates states of shape (N, 54) by symmetries given as permutations of shape (K, 54), returns shape (N, K, 54)
+# the facelets are moved and then the colors are relabeled so that every center keeps its color,
+# which is the state seen in the transformed frame. Rows whose centers do not have six distinct colors
+# (e.g. masked centers) are only moved, so they compare as pictures. Colors that are not on a center are never relabeled
+def conjugate_states(states: np.ndarray, permutations: np.ndarray):
+    states = np.asarray(states, dtype=np.uint8).reshape(-1, 54)
+    moved = states[:, permutations]
+    centers = states[:, center_facelets]
+    sorted_centers = np.sort(centers, axis=1)
+    distinct = (sorted_centers[:, 1:] != sorted_centers[:, :-1]).all(axis=1)
+    if not distinct.any():
+        return moved
+    recolored = moved if distinct.all() else moved[distinct]
+    rows = len(recolored) * len(permutations)
+    # one 256-entry color lookup per (state, symmetry), read with a single flat gather
+    relabel = np.empty((rows, 256), dtype=np.uint8)
+    relabel[:] = np.arange(256, dtype=np.uint8)
+    flat = recolored.reshape(rows, 54)
+    relabel[np.arange(rows)[:, None], flat[:, center_facelets]] = np.repeat(centers[distinct], len(permutations), axis=0)
+    recolored = relabel.ravel()[flat + (np.arange(rows) * 256)[:, None]].reshape(recolored.shape)
+    if distinct.all():
+        return recolored
+    moved[distinct] = recolored
+    return moved
+
+
+def conjugate(state, symmetry: int):
+    return conjugate_states(state, symmetry_permutations[symmetry:symmetry + 1])[0, 0]
+
+
+# returns the canonical representative of each state (N, 54): the lexicographically smallest of its symmetric images
+# symmetries is a name from symmetry_groups, auf adds the 4 pre-AUF turns
+def canonical_states(states: np.ndarray, symmetries='all', auf=False):
+    states = np.asarray(states, dtype=np.uint8).reshape(-1, 54)
+    permutations = get_candidate_permutations(symmetries, auf)
+    canonical = np.empty_like(states)
+    for start in range(0, len(states), hash_chunk_rows):
+        candidates = np.ascontiguousarray(conjugate_states(states[start:start + hash_chunk_rows], permutations))
+        # a row of 54 nonzero color codes read as a byte string compares lexicographically
+        smallest = np.argmin(candidates.view('S54')[:, :, 0], axis=1)
+        canonical[start:start + hash_chunk_rows] = candidates[np.arange(len(candidates)), smallest]
+    return canonical
+
+
+def canonical_state(state, symmetries='all', auf=False):
+    return canonical_states(state, symmetries, auf)[0]
+
+
+# random odd 64-bit multipliers per facelet, fixed so hashes are stable across runs and processes
+hash_multipliers = np.random.default_rng(0x5EED).integers(1, 2 ** 63, 54, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+
+# stable 64-bit hashes of states of shape (N, 54): a multiply-add over the facelets followed by the splitmix64 finalizer
+def hash_states(states: np.ndarray):
+    states = np.asarray(states, dtype=np.uint8).reshape(-1, 54)
+    with np.errstate(over='ignore'):
+        h = states.astype(np.uint64) @ hash_multipliers
+        h ^= h >> np.uint64(30)
+        h *= np.uint64(0xBF58476D1CE4E5B9)
+        h ^= h >> np.uint64(27)
+        h *= np.uint64(0x94D049BB133111EB)
+        h ^= h >> np.uint64(31)
+    return h
+
+
+def hash_state(state):
+    return int(hash_states(state)[0])
+
+
+# remembers canonical states so that equivalent states are only processed once
+# keys are 64-bit hashes of canonical states, or the canonical states themselves with exact=True (no false positives)
+# values can be stored with put and read back with get, e.g. the result computed for the first state of a class
+class TranspositionTable:
+    def __init__(self, symmetries='all', auf=False, exact=False):
+        self.permutations = get_candidate_permutations(symmetries, auf)
+        self.symmetries = symmetries
+        self.auf = auf
+        self.exact = exact
+        self.entries = dict()
+        self.hits = 0
+        self.misses = 0
+
+    # returns the keys of states of shape (N, 54)
+    def keys(self, states: np.ndarray):
+        states = np.asarray(states, dtype=np.uint8).reshape(-1, 54)
+        canonical = canonical_states(states, self.symmetries, self.auf)
+        if self.exact:
+            return [row.tobytes() for row in canonical]
+        return hash_states(canonical).tolist()
+
+    def key(self, state):
+        return self.keys(state)[0]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, state):
+        return self.key(state) in self.entries
+
+    def get(self, state, default=None):
+        return self.entries.get(self.key(state), default)
+
+    def put(self, state, value=True):
+        self.entries[self.key(state)] = value
+
+    # returns True if an equivalent state was seen before, otherwise records the state and returns False
+    # a tag (any hashable, e.g. the algorithm run on the state) keeps separate sets of states apart
+    def seen(self, state, tag=None):
+        key = self.key(state) if tag is None else (tag, self.key(state))
+        if key in self.entries:
+            self.hits += 1
+            return True
+        self.misses += 1
+        self.entries[key] = True
+        return False
+
+    # batch version of seen: returns a boolean mask of the rows that are new, recording them
+    # of several equivalent rows in the batch only the first one counts as new
+    def filter_new(self, states: np.ndarray):
+        new = []
+        for key in self.keys(states):
+            is_new = key not in self.entries
+            if is_new:
+                self.entries[key] = True
+            new.append(is_new)
+        new = np.array(new, dtype=bool)
+        self.misses += int(new.sum())
+        self.hits += int(len(new) - new.sum())
+        return new
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
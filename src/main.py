@@ -1,15 +1,14 @@
-from src import Cube
+from src import Cube, Mask
 
 def main():
     cube = Cube.Cube(verbose=False)
-    # F2B + M slice centers
     cube.do_moves('y z2')  # yellow top, red front
+    # F2B + M slice centers are hidden in the images only, the cube keeps its colors
     centers = ['U', 'R', 'F', 'D', 'L', 'B']
     F2B = ['LF', 'LD', 'LB', 'LFD', 'LBD', 'RF', 'RD', 'RB', 'RFD', 'RBD']
-    for piece_str in centers + F2B:
-        cube.set_piece_color([char for char in piece_str], 't')
+    sticker_mask = Mask.StickerMask.from_pieces(centers + F2B, 't' * len(centers + F2B))
 
-    initial_state = cube.get_state()  # save the state to come back to it later
+    initial_state = cube.snapshot()  # save the state to come back to it later
 
     eo_cases = ["M'U'MU2M'UM",
                 "M'U'MU2M'UMU",
@@ -31,10 +30,10 @@ def main():
     cmll_setup = "L' U R U' L U' R' U' R U' R' M2 U M' U2 M U M2 U'"
     i = 0
     for eo_setup in eo_cases:
-        url_before, url_after = cube.CMLL_affects_EO(cmll, cmll_setup, eo_setup)
+        url_before, url_after = cube.CMLL_affects_EO(cmll, cmll_setup, eo_setup, sticker_mask=sticker_mask)
         print(i, '\tBefore', url_before)
         print(' \tAfter ', url_after)
-        cube.set_state(initial_state)
+        cube.restore(initial_state)
         i += 1
 
 
@@ -0,0 +1,96 @@
+import time
+import asyncio
+import threading
+from urllib.parse import urlsplit, parse_qs
+import pytest
+from src import Cube, Fetch
+
+solved_fc = Cube.Cube().get_facelets_string()
+
+
+# the local server with two test parameters: delay=<seconds> before answering and fail=<n> to answer the first n
+# requests for a URL with 503
+class FlakyHandler(Fetch.LocalVisualCubeHandler):
+    failures = dict()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        query = {key: values[0] for key, values in parse_qs(urlsplit(self.path).query).items()}
+        time.sleep(float(query.get('delay', 0)))
+        with self.lock:
+            failed = self.failures.get(self.path, 0)
+            if failed < int(query.get('fail', 0)):
+                self.failures[self.path] = failed + 1
+                self.send_error(503)
+                return
+        super().do_GET()
+
+
+@pytest.fixture
+def base_url():
+    FlakyHandler.failures.clear()
+    server, url = Fetch.serve_local(handler=FlakyHandler)
+    yield url
+    server.shutdown()
+    server.server_close()
+
+
+def stream(urls, **fetcher_options):
+    async def collect():
+        return [result async for result in Fetch.BulkFetcher(**fetcher_options).stream(urls)]
+    return asyncio.run(collect())
+
+
+def test_results_stream_in_completion_order(base_url):
+    urls = [Fetch.visualcube_url(solved_fc, base_url=base_url) + '&delay=0.5',
+            Fetch.visualcube_url(solved_fc, base_url=base_url)]
+    results = stream(urls, concurrency=2)
+    assert [index for index, result in results] == [1, 0]
+    for index, result in results:
+        assert result['status'] == 200
+        assert result['content'].startswith(b'<svg')
+        assert result['attempts'] == 1
+
+
+def test_failures_are_retried_with_backoff(base_url):
+    url = Fetch.visualcube_url(solved_fc, base_url=base_url) + '&fail=2'
+    start = time.monotonic()
+    [(index, result)] = stream([url], retries=3, backoff=0.1)
+    assert result['status'] == 200 and result['error'] is None
+    assert result['attempts'] == 3
+    assert time.monotonic() - start >= 0.1 + 0.2
+
+
+def test_retries_give_up_with_the_last_error(base_url):
+    url = Fetch.visualcube_url(solved_fc, base_url=base_url) + '&fail=5'
+    [(index, result)] = stream([url], retries=1, backoff=0.01)
+    assert result['status'] == 503
+    assert result['attempts'] == 2
+    assert isinstance(result['error'], Fetch.HTTPError)
+
+
+def test_bad_queries_are_answered_with_400(base_url):
+    urls = [Fetch.visualcube_url(solved_fc, view='plan', base_url=base_url),
+            Fetch.visualcube_url('www', base_url=base_url),
+            base_url + '?size=abc']
+    results = dict(stream(urls, retries=2, backoff=0.01))
+    for index in range(len(urls)):
+        assert results[index]['status'] == 400
+        assert results[index]['attempts'] == 1
+
+
+def test_rate_limits_request_starts(base_url):
+    start = time.monotonic()
+    results = Fetch.fetch_all([solved_fc] * 5, base_url=base_url, concurrency=5, rate=20)
+    assert all(result['status'] == 200 for result in results)
+    assert time.monotonic() - start >= 4 / 20
+
+
+def test_connections_are_reused(base_url):
+    fetcher = Fetch.BulkFetcher(concurrency=2)
+
+    async def collect():
+        return [result async for result in fetcher.stream([Fetch.visualcube_url(solved_fc, base_url=base_url)] * 10)]
+
+    assert len(asyncio.run(collect())) == 10
+    assert fetcher.pool.opened <= 2